@@ -3,16 +3,30 @@ from flask_flatpages import FlatPages
 from flask_frozen import Freezer
 import logging.handlers
 import logging
+import os
+import threading
 
-from vc3client import client
-from ConfigParser import SafeConfigParser
+import click
+
+from portal.infoservice import VC3ClientPool, PooledVC3Client
+from portal.entity_cache import EntityCache
+from portal.catalog import EntityCatalog
+from portal.fanout import FanOut
+from portal.snapshot import SnapshotRefresher
+from portal.events import StatusBroker
+from portal.singleflight import SingleFlight
+from portal.blog import BlogIndex
+from portal.page_cache import RenderedPageCache, PageReloader
+from portal.search import SearchIndex
+from portal import (assets, compression, fragment_cache, freeze, images,
+                    lazy, request_cache, template_cache)
 
 __author__ = 'Jeremy Van <jeremyvan@uchicago.edu>'
 
 
 app = Flask(__name__)
 app.config.from_pyfile('portal.conf')
-app.config['TEMPLATES_AUTO_RELOAD'] = True
+app.config.from_envvar('VC3_PORTAL_SETTINGS', silent=True)
 
 # set up logging
 handler = logging.handlers.RotatingFileHandler(filename=app.config['VC3_WEBSITE_LOGFILE'])
@@ -22,25 +36,123 @@ formatter = logging.Formatter('%(asctime)s - %(levelname)s: %(message)s')
 handler.setFormatter(formatter)
 
 pages = FlatPages(app)
-freezer = Freezer(app)
+page_cache = RenderedPageCache(
+    app.config['FLATPAGES_HTML_RENDERER'],
+    directory=app.config.get('VC3_PAGES_CACHE_DIR',
+                             os.path.join(app.instance_path, 'rendered_pages')),
+    max_entries=app.config.get('VC3_PAGES_CACHE_SIZE', 1024))
+app.config['FLATPAGES_HTML_RENDERER'] = page_cache.html_renderer()
+search_index = SearchIndex(
+    pages,
+    path=app.config.get('VC3_SEARCH_INDEX_PATH',
+                        os.path.join(app.instance_path, 'search_index.json')),
+    logger=app.logger)
+page_reloader = None
+if app.config.get('VC3_PAGES_RELOAD_INTERVAL', 30):
+    page_reloader = PageReloader(
+        pages, page_cache,
+        interval=app.config.get('VC3_PAGES_RELOAD_INTERVAL', 30),
+        processes=app.config.get('VC3_PAGES_PRERENDER_PROCESSES', 4),
+        logger=app.logger)
+    page_reloader.subscribe(search_index.refresh)
+blog_index = BlogIndex(pages)
+# only the public pages are frozen, see `flask freeze`
+freezer = Freezer(app, with_static_files=False, with_no_argument_rules=False,
+                  log_url_for=False)
+freeze.init_app(app, freezer, blog_index)
+
+vc3_client_pool = VC3ClientPool(
+    app.config['VC3_CLIENT_CONFIG'],
+    size=app.config.get('VC3_CLIENT_POOL_SIZE', 8),
+    reload_interval=app.config.get('VC3_CLIENT_CONFIG_CHECK_INTERVAL', 5),
+    logger=app.logger)
+vc3_entity_cache = EntityCache(
+    ttl=app.config.get('VC3_CACHE_TTL'),
+    max_entries=app.config.get('VC3_CACHE_SIZE', 512))
+vc3_snapshot = None
+vc3_status_broker = None
+if app.config.get('VC3_SNAPSHOT_INTERVAL', 15):
+    vc3_snapshot = SnapshotRefresher(
+        vc3_client_pool,
+        interval=app.config.get('VC3_SNAPSHOT_INTERVAL', 15),
+        max_age=app.config.get('VC3_SNAPSHOT_MAX_AGE'),
+        logger=app.logger)
+    vc3_snapshot.sync.subscribe(vc3_entity_cache.apply_changes)
+    vc3_status_broker = StatusBroker(
+        vc3_snapshot, keepalive=app.config.get('VC3_EVENTS_KEEPALIVE', 15),
+        logger=app.logger)
+vc3_client = PooledVC3Client(vc3_client_pool, cache=vc3_entity_cache,
+                             snapshot=vc3_snapshot,
+                             single_flight=SingleFlight())
+request_cache.init_app(app)
+lazy.init_app(app)
+compression.init_app(app)
+assets.init_app(app)
+images.init_app(app)
+vc3_fragment_cache = fragment_cache.init_app(app, vc3_client.list_version)
+if vc3_snapshot is not None:
+    vc3_snapshot.sync.subscribe(vc3_fragment_cache.apply_changes)
+template_cache.init_app(app)
+
+_start_lock = threading.Lock()
+_started = False
+
+def start():
+    """
+    Start the background work of a process serving the portal
+
+    Nothing is started on import, so CLI commands, and the worker processes
+    they fork, don't run threads they have no use for.  Called before the
+    first request, or earlier by run_portal.py.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    if vc3_snapshot is not None:
+        vc3_snapshot.start()
+    if page_reloader is not None:
+        page_reloader.start()
+    template_cache.warm_up(app)
+
+@app.before_first_request
+def _start_serving():
+    # CLI commands that make requests, like freeze, and the workers they
+    # fork are not serving, `flask run` is
+    context = click.get_current_context(silent=True)
+    if context is None or context.info_name == 'run':
+        start()
 
 def get_vc3_client():
     """
-    Return a VC3 client instance
+    Return the shared, pooled VC3 client
 
     :return: VC3 client instance on success
     """
-    c = SafeConfigParser()
-    c.readfp(open(app.config['VC3_CLIENT_CONFIG']))
+    return vc3_client
 
-    try:
-        client_api = client.VC3ClientAPI(c)
-        return client_api
-    except Exception as e:
-        app.logger.error("Couldn't get vc3 client: {0}".format(e))
-        raise
+vc3_catalog = EntityCatalog(vc3_client)
+
+def get_vc3_catalog():
+    """
+    Return the shared, indexed catalog of infoservice entities
+
+    :return: EntityCatalog instance
+    """
+    return vc3_catalog
+
+def get_status_broker():
+    """
+    Return the broker of status change events
+
+    :return: StatusBroker instance, or None without a background snapshot
+    """
+    return vc3_status_broker
 
-app.jinja_env.globals.update(get_vc3_client=get_vc3_client)
+vc3_fanout = FanOut(processes=app.config.get('VC3_FANOUT_THREADS', 8),
+                    timeout=app.config.get('VC3_FANOUT_TIMEOUT', 30),
+                    logger=app.logger)
 
 # need to put this here since views uses the app object
 import portal.views
@@ -0,0 +1,201 @@
+"""
+Fingerprinted static asset bundles.
+
+The stylesheets and scripts the layouts load are combined into bundles,
+minified, and written by the ``build-assets`` command to ``static/dist``
+under names carrying a hash of their content.  Templates link them with
+``asset_url()``, which takes the same filename ``url_for('static', ...)``
+would, and the hashed files are served with a one-year, immutable
+``Cache-Control`` so browsers never revalidate them.  A new build gets new
+names, so changed assets are picked up on the next page view.
+
+Until the bundles are built, ``asset_url()`` links the bundle name itself
+and the static route serves the concatenated sources with the usual
+revalidating headers.
+"""
+import collections
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import make_response, request, safe_join, url_for
+
+from portal import compression
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+#: Bundle name to the static files it combines, in order
+BUNDLES = collections.OrderedDict([
+    ('css/site.css', ['css/jarostyle.css']),
+    ('css/dashboard.css', ['css/light-bootstrap-dashboard.css']),
+    ('js/portal.js', ['js/custom.js', 'js/status.js']),
+])
+#: Directory of the static folder the bundles are written to
+DIST = 'dist'
+#: Cache-Control of fingerprinted files, which never change
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_FINGERPRINTED = re.compile(r'\.[0-9a-f]{12}(-\d+w)?\.\w+$')
+#: Quoted strings and url() of a stylesheet, which minifying must not
+#: change, or a comment
+_CSS_LITERAL = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|"""
+                          r"""url\([^)]*\))|/\*.*?\*/""", re.S)
+_CSS_PLACEHOLDER = re.compile(u'\x00(\\d+)\x00')
+
+
+def minify_css(source):
+    """Strip comments and redundant whitespace from a stylesheet"""
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    literals = []
+
+    def protect(match):
+        if match.group(1) is None:
+            # a comment
+            return ''
+        literals.append(match.group(1))
+        return u'\x00%d\x00' % (len(literals) - 1)
+
+    source = _CSS_LITERAL.sub(protect, source)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    source = source.replace(';}', '}').strip()
+    return _CSS_PLACEHOLDER.sub(lambda m: literals[int(m.group(1))], source)
+
+
+def minify_js(source):
+    """
+    Strip blank lines, line comments and indentation from a script
+
+    Without the optional ``rjsmin`` module this stays conservative: lines
+    continuing a string literal are kept as they are.
+    """
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+    lines = []
+    continued = False
+    for line in source.splitlines():
+        if continued:
+            lines.append(line)
+        else:
+            line = line.strip()
+            if line and not line.startswith('//'):
+                lines.append(line)
+        continued = line.endswith('\\')
+    return '\n'.join(lines)
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def bundle_source(static_folder, name):
+    """Concatenated, unminified sources of a bundle"""
+    parts = []
+    for filename in BUNDLES[name]:
+        with open(safe_join(static_folder, filename), 'rb') as f:
+            parts.append(f.read().decode('utf-8'))
+    # a statement left open at the end of one script mustn't swallow the
+    # next one
+    separator = u';\n' if name.endswith('.js') else u'\n'
+    return separator.join(parts)
+
+
+def build_assets(static_folder):
+    """
+    Write minified, fingerprinted bundles and their manifest
+
+    :return: manifest mapping bundle names to fingerprinted filenames
+    """
+    dist = os.path.join(static_folder, DIST)
+    if not os.path.isdir(dist):
+        os.makedirs(dist)
+    manifest = {}
+    for name in BUNDLES:
+        base, ext = os.path.splitext(os.path.basename(name))
+        data = MINIFIERS[ext](bundle_source(static_folder, name))
+        data = data.encode('utf-8')
+        digest = hashlib.sha1(data).hexdigest()[:12]
+        filename = '%s/%s.%s%s' % (DIST, base, digest, ext)
+        path = os.path.join(static_folder, filename)
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.rename(path + '.tmp', path)
+        manifest[name] = filename
+    path = os.path.join(dist, 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.rename(path + '.tmp', path)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Manifest written by the last build, empty if there was none"""
+    try:
+        with open(os.path.join(static_folder, DIST, 'manifest.json')) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def init_app(app):
+    """Link, serve and build the fingerprinted asset bundles"""
+    manifest = load_manifest(app.static_folder)
+
+    def asset_url(filename, **values):
+        """
+        URL of a static file or bundle, fingerprinted when it was built
+
+        Takes the same arguments as ``url_for('static', ...)``.
+        """
+        return url_for('static', filename=manifest.get(filename, filename),
+                       **values)
+
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    static_view = app.view_functions['static']
+
+    def send_static_file(filename):
+        if filename in BUNDLES and not os.path.exists(
+                safe_join(app.static_folder, filename)):
+            response = make_response(
+                bundle_source(app.static_folder, filename))
+            response.mimetype = mimetypes.guess_type(filename)[0]
+            response.add_etag()
+            return response.make_conditional(request)
+        return static_view(filename)
+
+    app.view_functions['static'] = send_static_file
+
+    @app.after_request
+    def cache_fingerprinted(response):
+        filename = (request.view_args or {}).get('filename', '')
+        if (request.endpoint == 'static' and
+                response.status_code in (200, 304) and
+                filename.startswith(DIST + '/') and
+                _FINGERPRINTED.search(filename)):
+            response.headers['Cache-Control'] = IMMUTABLE
+            response.headers.pop('Expires', None)
+        return response
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Write the minified, fingerprinted asset bundles."""
+        manifest.clear()
+        manifest.update(build_assets(app.static_folder))
+        for name, filename in sorted(manifest.items()):
+            click.echo('%s -> %s' % (name, filename))
+        compression.compress_static(
+            os.path.join(app.static_folder, DIST),
+            app.config.get('VC3_COMPRESS_MIN_SIZE', 500))
@@ -0,0 +1,139 @@
+"""
+Index of the blog articles.
+
+The blog and tag views used to sort every page by date, or scan every
+page's tags, on each request.  ``BlogIndex`` sorts the articles once, and
+indexes them by tag and by month, whenever FlatPages loads or reloads the
+pages; views then only slice out the articles they show.
+"""
+import collections
+import datetime
+import threading
+
+
+def article_month(article):
+    """(year, month) an article was published in, None if unknown"""
+    date = article.meta['date']
+    if isinstance(date, (datetime.date, datetime.datetime)):
+        return date.year, date.month
+    try:
+        return int(str(date)[:4]), int(str(date)[5:7])
+    except ValueError:
+        return None
+
+
+class Pagination(object):
+    """
+    One page of a list of articles
+
+    :param items: all articles of the list, in order
+    :param page: number of the page, starting at 1
+    :param per_page: number of articles on a page
+    """
+
+    def __init__(self, items, page, per_page):
+        self.page = page
+        self.per_page = per_page
+        self.total = len(items)
+        self.items = items[(page - 1) * per_page:page * per_page]
+
+    @property
+    def pages(self):
+        return max(1, (self.total + self.per_page - 1) // self.per_page)
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def exists(self):
+        """Whether the page is in range; the first page always exists"""
+        return 1 <= self.page <= self.pages
+
+
+class _Index(object):
+
+    def __init__(self, pages):
+        pages = list(pages)
+        self.articles = sorted((p for p in pages if 'date' in p.meta),
+                               key=lambda p: p.meta['date'], reverse=True)
+        # pages without a date can be tagged too, they are listed last
+        undated = sorted((p for p in pages if 'date' not in p.meta),
+                         key=lambda p: p.path)
+        self.tags = collections.defaultdict(list)
+        self.months = collections.OrderedDict()
+        for page in self.articles + undated:
+            for tag in page.meta.get('tags') or []:
+                self.tags[tag].append(page)
+        for article in self.articles:
+            month = article_month(article)
+            if month is not None:
+                self.months.setdefault(month, []).append(article)
+        self.tag_counts = sorted(
+            ((tag, len(articles)) for tag, articles in self.tags.items()),
+            key=lambda item: (-item[1], item[0]))
+        self.month_counts = list((key, len(articles))
+                                 for key, articles in self.months.items())
+
+
+class BlogIndex(object):
+    """
+    Date ordered articles of a FlatPages instance, by tag and by month
+
+    Articles are the pages with a ``date``.  The index is rebuilt the first
+    time it is used after FlatPages (re)loaded its pages.
+
+    :param pages: FlatPages instance
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self._lock = threading.Lock()
+        # loaded pages and their index, replaced together
+        self._indexed = (None, None)
+
+    def _current(self):
+        # FlatPages keeps the loaded pages in a dict it replaces on reload
+        loaded = self.pages._pages
+        indexed, index = self._indexed
+        if indexed is loaded:
+            return index
+        with self._lock:
+            indexed, index = self._indexed
+            if indexed is not loaded:
+                index = _Index(loaded.values())
+                self._indexed = (loaded, index)
+            return index
+
+    @property
+    def articles(self):
+        """All articles, most recent first"""
+        return self._current().articles
+
+    def latest(self, page=1, per_page=10):
+        """Pagination of all articles, most recent first"""
+        return Pagination(self._current().articles, page, per_page)
+
+    def tagged(self, tag, page=1, per_page=10):
+        """
+        Pagination of the pages with a tag, most recent first and pages
+        without a date last
+        """
+        return Pagination(self._current().tags.get(tag, []), page, per_page)
+
+    def archive(self, year, month, page=1, per_page=10):
+        """Pagination of the articles of a month, most recent first"""
+        return Pagination(self._current().months.get((year, month), []),
+                          page, per_page)
+
+    def tags(self):
+        """Tags and their number of pages, most used first"""
+        return self._current().tag_counts
+
+    def months(self):
+        """(year, month) and number of articles, most recent first"""
+        return self._current().month_counts
@@ -0,0 +1,163 @@
+"""
+Hash indexes over infoservice entity lists.
+
+Decorators and views used to answer questions such as "which user has this
+identity id" or "is this user in any project" by scanning a whole entity
+list.  ``EntityCatalog`` builds the indexes once per version of a list and
+keeps them until the snapshot or the entity cache holds a new version, so
+lookups stay O(1) however many users and clusters the infoservice holds.
+"""
+import copy
+
+
+#: Attributes indexed per entity type, as (unique, multi) tuples.  Unique
+#: attributes map a value to a single entity, multi attributes map a value to
+#: every entity holding it.  List-valued attributes, such as project members,
+#: are indexed by each of their items.
+INDEXED_ATTRIBUTES = {
+    'user': (('name', 'identity_id'), ()),
+    'project': (('name',), ('owner', 'members', 'allocations')),
+    'allocation': (('name',), ('owner', 'resource')),
+    'resource': (('name',), ()),
+    'cluster': (('name',), ('owner',)),
+    'nodeset': (('name',), ('owner',)),
+    'request': (('name', 'headnode'), ('owner', 'project', 'cluster')),
+    'environment': (('name',), ('owner',)),
+}
+
+#: VC3ClientAPI method listing every entity of a type
+LIST_METHODS = {
+    'user': 'listUsers',
+    'project': 'listProjects',
+    'allocation': 'listAllocations',
+    'resource': 'listResources',
+    'cluster': 'listClusters',
+    'nodeset': 'listNodesets',
+    'request': 'listRequests',
+    'environment': 'listEnvironments',
+}
+
+#: VC3ClientAPI method, and its name argument, fetching a single entity
+GET_METHODS = {
+    'user': ('getUser', 'username'),
+    'project': ('getProject', 'projectname'),
+    'allocation': ('getAllocation', 'allocationname'),
+    'resource': ('getResource', 'resourcename'),
+    'nodeinfo': ('getNodeinfo', 'nodeinfoName'),
+    'cluster': ('getCluster', 'clustername'),
+    'nodeset': ('getNodeset', 'nodesetname'),
+    'request': ('getRequest', 'requestname'),
+    'environment': ('getEnvironment', 'environmentname'),
+}
+
+
+class EntityIndex(object):
+    """Hash indexes over one list of entities"""
+
+    def __init__(self, entities, unique=('name',), multi=()):
+        self.entities = entities
+        self._unique = dict((attr, {}) for attr in unique)
+        self._multi = dict((attr, {}) for attr in multi)
+
+        for entity in entities:
+            for attr, index in self._unique.items():
+                value = getattr(entity, attr, None)
+                if value is not None:
+                    index[value] = entity
+            for attr, index in self._multi.items():
+                values = getattr(entity, attr, None)
+                if values is None:
+                    continue
+                if not isinstance(values, (list, tuple, set)):
+                    values = [values]
+                for value in values:
+                    index.setdefault(value, []).append(entity)
+
+    def get(self, attr, value):
+        """
+        Entity whose unique attribute ``attr`` equals ``value``
+
+        :return: entity, or None if there is no such entity
+        """
+        entity = self._unique[attr].get(value)
+        if entity is None:
+            return None
+        return copy.deepcopy(entity)
+
+    def filter(self, attr, value):
+        """
+        Entities whose attribute ``attr`` equals or contains ``value``
+
+        :return: list of entities
+        """
+        return copy.deepcopy(self._multi[attr].get(value, []))
+
+    def __len__(self):
+        return len(self.entities)
+
+
+class EntityCatalog(object):
+    """
+    Indexed view of the infoservice built on top of the shared client
+
+    Entity lists are read through the client, so they come out of the
+    request memo, the snapshot or the entity cache when possible.  Indexes
+    are rebuilt only when the list they were built from changes.  Entities
+    are copied when indexed and when looked up, as views modify them.
+    """
+
+    def __init__(self, vc3_client):
+        self._client = vc3_client
+        self._indexes = {}
+
+    def _version(self, entity_type):
+        return self._client.list_version(entity_type)
+
+    def index(self, entity_type):
+        """
+        Return the EntityIndex of an entity type
+
+        :param entity_type: entity type, e.g. 'project'
+        :return: EntityIndex instance
+        """
+        # read once, before the list: the list is at least as recent, so an
+        # index is never kept under a version newer than its entities
+        version = self._version(entity_type)
+        built = self._indexes.get(entity_type)
+        if version is not None and built is not None and built[0] == version:
+            return built[1]
+
+        entities = getattr(self._client, LIST_METHODS[entity_type])()
+        unique, multi = INDEXED_ATTRIBUTES[entity_type]
+        index = EntityIndex(copy.deepcopy(entities), unique, multi)
+        if version is not None:
+            self._indexes[entity_type] = (version, index)
+        return index
+
+    def get(self, entity_type, attr, value):
+        """Look up an entity by one of its unique attributes"""
+        return self.index(entity_type).get(attr, value)
+
+    def filter(self, entity_type, attr, value):
+        """Look up entities by one of their multi-valued attributes"""
+        return self.index(entity_type).filter(attr, value)
+
+    def user_by_identity(self, identity_id):
+        """User profile linked to a Globus identity id"""
+        return self.get('user', 'identity_id', identity_id)
+
+    def projects_of_user(self, username):
+        """Projects owned by or including ``username`` as a member"""
+        index = self.index('project')
+        projects = index.filter('owner', username)
+        names = set(p.name for p in projects)
+        for project in index.filter('members', username):
+            if project.name not in names:
+                projects.append(project)
+        return projects
+
+    def headnode_of(self, vc3_request):
+        """Headnode nodeset of a virtual cluster, or None"""
+        if not vc3_request.headnode:
+            return None
+        return self.get('nodeset', 'name', vc3_request.headnode)
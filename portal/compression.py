@@ -0,0 +1,166 @@
+"""
+Response compression.
+
+Rendered pages and JSON responses above ``VC3_COMPRESS_MIN_SIZE`` bytes are
+compressed with brotli, when the ``brotli`` module is installed and the
+client accepts it, or with gzip.  Static assets are compressed once, at
+build time, by the ``compress-static`` command; the static route serves the
+``.br``/``.gz`` siblings it writes instead of compressing on every request.
+"""
+import gzip
+import io
+import mimetypes
+import os
+
+import click
+from flask import request, safe_join, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#: Mimetypes worth compressing
+COMPRESSIBLE_MIMETYPES = ('text/html', 'text/css', 'text/plain',
+                          'text/javascript', 'application/javascript',
+                          'application/json', 'image/svg+xml')
+#: File extensions of static assets worth compressing
+COMPRESSIBLE_EXTENSIONS = ('.html', '.css', '.js', '.json', '.svg', '.txt',
+                           '.map')
+
+
+def _gzip(data, best=False):
+    buf = io.BytesIO()
+    # a fixed mtime keeps the output identical for identical input
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9 if best else 6,
+                       mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def _brotli(data, best=False):
+    return brotli.compress(data, quality=11 if best else 5)
+
+
+#: Supported encodings, most preferred first, with the function and the
+#: file extension of each
+ENCODINGS = [('gzip', _gzip, '.gz')]
+if brotli is not None:
+    ENCODINGS.insert(0, ('br', _brotli, '.br'))
+
+
+def accepted_encodings():
+    """Supported encodings the client accepts, most preferred first"""
+    accepted = request.accept_encodings
+    return [(name, fn, ext) for name, fn, ext in ENCODINGS
+            if accepted[name] > 0]
+
+
+def compress_response(response, min_size):
+    """
+    Compress a response body in place if the client accepts it
+
+    Streamed responses, such as event streams, and responses passed through
+    from files are left alone.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or
+            response.is_streamed or
+            'Content-Encoding' in response.headers or
+            response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encodings = accepted_encodings()
+    if not encodings:
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    name, fn, _ = encodings[0]
+    response.set_data(fn(data))
+    response.headers['Content-Encoding'] = name
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        # the encoded body differs, so it can only be weakly equal
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def send_static_file(app, filename):
+    """
+    Serve a static file, or its precompressed sibling if there is a
+    current one the client accepts
+    """
+    static_folder = app.static_folder
+    source = safe_join(static_folder, filename)
+    for name, _, ext in accepted_encodings():
+        sibling = source + ext
+        try:
+            current = os.path.getmtime(sibling) >= os.path.getmtime(source)
+        except OSError:
+            continue
+        if current:
+            response = send_from_directory(
+                static_folder, filename + ext,
+                mimetype=(mimetypes.guess_type(filename)[0] or
+                          'application/octet-stream'),
+                cache_timeout=app.get_send_file_max_age(filename))
+            response.headers['Content-Encoding'] = name
+            response.vary.add('Accept-Encoding')
+            return response
+    response = app.send_static_file(filename)
+    if os.path.splitext(filename)[1] in COMPRESSIBLE_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress_static(static_folder, min_size, force=False):
+    """
+    Write compressed siblings of every compressible static file
+
+    :param force: recompress files whose siblings are up to date
+    :return: list of paths written
+    """
+    written = []
+    for root, _, files in os.walk(static_folder):
+        for filename in files:
+            source = os.path.join(root, filename)
+            if (os.path.splitext(filename)[1] not in COMPRESSIBLE_EXTENSIONS or
+                    os.path.getsize(source) < min_size):
+                continue
+            data = None
+            for _, fn, ext in ENCODINGS:
+                sibling = source + ext
+                if (not force and os.path.exists(sibling) and
+                        os.path.getmtime(sibling) >= os.path.getmtime(source)):
+                    continue
+                if data is None:
+                    with open(source, 'rb') as f:
+                        data = f.read()
+                with open(sibling, 'wb') as f:
+                    f.write(fn(data, best=True))
+                written.append(sibling)
+    return written
+
+
+def init_app(app):
+    """Compress dynamic responses and serve precompressed static files"""
+    min_size = app.config.get('VC3_COMPRESS_MIN_SIZE', 500)
+
+    @app.after_request
+    def compress(response):
+        return compress_response(response, min_size)
+
+    app.view_functions['static'] = lambda filename: send_static_file(
+        app, filename)
+
+    @app.cli.command('compress-static')
+    @click.option('--force', is_flag=True,
+                  help='Recompress files that are up to date.')
+    def compress_static_command(force):
+        """Write .gz and .br siblings of the static assets."""
+        written = compress_static(app.static_folder, min_size, force)
+        for path in written:
+            click.echo(path)
+        if brotli is None:
+            click.echo('brotli is not installed, only wrote .gz files')
@@ -1,6 +1,13 @@
-from flask import redirect, request, session, url_for, flash
+from flask import (redirect, request, session, url_for, flash,
+                   make_response)
 from functools import wraps
-from portal.utils import get_vc3_client
+import hashlib
+import time
+from portal import app
+from portal.utils import get_vc3_client, get_vc3_catalog
+
+# snapshot and cache versions restart with the process
+_process_token = repr(time.time())
 
 
 def authenticated(fn):
@@ -26,11 +33,10 @@ def allocation_validated(f):
     """Mark a route as requiring a validated allocation."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        vc3_client = get_vc3_client()
-        allocations = vc3_client.listAllocations()
+        allocations = get_vc3_catalog().filter('allocation', 'owner',
+                                               session['name'])
         for allocation in allocations:
-            if (session['name'] == allocation.owner and
-                    allocation.state == "ready"):
+            if allocation.state == "ready":
                 return f(*args, **kwargs)
         flash('You must have a validated allocation to create a project.', 'warning')
         return redirect(url_for('list_allocations', next=request.url))
@@ -41,12 +47,64 @@ def project_exists(f):
     """Mark a route as requiring being within any validated project."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        vc3_client = get_vc3_client()
-        projects = vc3_client.listProjects()
-        for project in projects:
-            if (session['name'] == project.owner or
-                    session['name'] in project.members):
-                return f(*args, **kwargs)
+        if get_vc3_catalog().projects_of_user(session['name']):
+            return f(*args, **kwargs)
         flash('You must be within a project in order to proceed.', 'warning')
         return redirect(url_for('list_projects', next=request.url))
     return decorated_function
+
+
+def _entity_etag(entity_types):
+    """
+    Strong ETag of the current request, derived from the versions of the
+    entity types its response is built from
+
+    :return: ETag, or None if some version is unknown
+    """
+    vc3_client = get_vc3_client()
+    versions = []
+    for entity_type in entity_types:
+        version = vc3_client.list_version(entity_type)
+        if version is None:
+            return None
+        versions.append(version)
+    user = sorted((k, v) for k, v in session.items() if k != '_flashes')
+    key = repr((_process_token, request.path, sorted(request.args.items(True)),
+                user, versions))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def conditional(*entity_types):
+    """
+    Mark a GET route as supporting conditional requests.
+
+    The ETag is derived from the versions of ``entity_types`` and the
+    session, so a matching If-None-Match is answered with 304 before the
+    view runs.  When some version is unknown the rendered body is hashed
+    instead.  Pages with pending flash messages are always rendered.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def decorated_function(*args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or
+                    session.get('_flashes')):
+                return fn(*args, **kwargs)
+
+            etag = _entity_etag(entity_types)
+            if (etag is not None and
+                    request.if_none_match.contains_weak(etag)):
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if etag is None:
+                    response.add_etag()
+                else:
+                    response.set_etag(etag)
+                response.make_conditional(request)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
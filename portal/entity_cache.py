@@ -0,0 +1,240 @@
+"""
+Cross-request cache of infoservice entities.
+
+Most infoservice entities change rarely, yet every page lists them again.
+``EntityCache`` keeps the results of ``list*``/``get*`` calls for a
+per-entity-type TTL, bounded by an LRU size limit.  Writes the portal makes
+through the shared client invalidate the entity types they touch, so the
+portal always sees its own changes; changes made by other infoservice
+clients become visible when the TTL runs out.
+"""
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+#: Default time to live, in seconds, of cached results per entity type.
+#: Requests and nodesets carry the state of running virtual clusters and
+#: change the most often.
+DEFAULT_TTL = {'user': 60,
+               'project': 30,
+               'allocation': 15,
+               'resource': 300,
+               'nodeinfo': 300,
+               'cluster': 60,
+               'nodeset': 10,
+               'request': 10,
+               'environment': 120}
+
+ENTITY_TYPES = tuple(DEFAULT_TTL)
+
+_READ_RE = re.compile(r'^(?:list|get)([A-Z][a-z]+?)s?$')
+_WRITE_RE = re.compile(r'^(?:store|delete|terminate)([A-Z][a-z]+)$')
+_LINK_RE = re.compile(r'^(?:add|remove)([A-Z][a-z]+)(?:To|From)([A-Z][a-z]+)$')
+
+
+def _entity_type(name):
+    entity_type = name.lower()
+    if entity_type in ENTITY_TYPES:
+        return entity_type
+    return None
+
+
+def read_entity_type(method):
+    """
+    Entity type returned by a VC3ClientAPI read method
+
+    :param method: method name, e.g. ``listRequests`` or ``getNodeinfo``
+    :return: entity type, or None if the method is not a known entity read
+    """
+    match = _READ_RE.match(method)
+    if match is None:
+        return None
+    return _entity_type(match.group(1))
+
+
+def written_entity_types(method):
+    """
+    Entity types modified by a VC3ClientAPI write method
+
+    :param method: method name, e.g. ``storeProject`` or
+                   ``addAllocationToProject``
+    :return: tuple of entity types, or None if they can't be determined and
+             every type should be considered modified
+    """
+    match = _WRITE_RE.match(method) or _LINK_RE.match(method)
+    if match is None:
+        return None
+    entity_types = tuple(_entity_type(g) for g in match.groups())
+    if None in entity_types:
+        return None
+    return entity_types
+
+
+class EntityCache(object):
+    """
+    Thread-safe TTL and LRU bounded cache of infoservice read results
+
+    Cached values are deep-copied on the way in and on the way out because
+    views modify the entities they are handed.
+    """
+
+    def __init__(self, ttl=None, max_entries=512):
+        self.ttl = dict(DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = dict((t, 0) for t in ENTITY_TYPES)
+        self._versions = 0
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0,
+                       'evictions': 0, 'invalidations': 0}
+
+    def generation(self, entity_type):
+        """
+        Current generation of an entity type
+
+        The generation changes every time the type is invalidated; a result
+        fetched under an older generation is not stored.
+        """
+        with self._lock:
+            return self._generations[entity_type]
+
+    def get(self, entity_type, key):
+        """
+        Look up a cached result
+
+        :return: tuple of (found, result)
+        """
+        return self.get_versioned(entity_type, key)[:2]
+
+    def get_versioned(self, entity_type, key):
+        """
+        Look up a cached result and its version
+
+        :return: tuple of (found, result, version)
+        """
+        if not self.ttl.get(entity_type):
+            return False, None, None
+        with self._lock:
+            entry = self._entries.get((entity_type, key))
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None, None
+            expires, value, version = entry
+            if expires < time.time():
+                del self._entries[(entity_type, key)]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return False, None, None
+            # mark as most recently used
+            del self._entries[(entity_type, key)]
+            self._entries[(entity_type, key)] = entry
+            self._stats['hits'] += 1
+        return True, copy.deepcopy(value), version
+
+    def version(self, entity_type, key):
+        """
+        Version of a cached result
+
+        Every stored result gets a new version, so structures derived from a
+        result can be reused for as long as its version stays the same.
+
+        :return: version number, or None if the result is not cached
+        """
+        with self._lock:
+            entry = self._entries.get((entity_type, key))
+            if entry is None or entry[0] < time.time():
+                return None
+            return entry[2]
+
+    def put(self, entity_type, key, value, generation):
+        """
+        Store a result fetched while ``entity_type`` was at ``generation``
+
+        :return: version of the stored result, or None if it wasn't stored
+        """
+        ttl = self.ttl.get(entity_type)
+        if not ttl:
+            return None
+        value = copy.deepcopy(value)
+        with self._lock:
+            if self._generations[entity_type] != generation:
+                # invalidated while the result was being fetched
+                return None
+            self._versions += 1
+            self._entries.pop((entity_type, key), None)
+            self._entries[(entity_type, key)] = (time.time() + ttl, value,
+                                                 self._versions)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+            return self._versions
+
+    def invalidate(self, entity_types=None):
+        """
+        Drop cached results
+
+        :param entity_types: iterable of entity types to drop, all types if
+                             None
+        """
+        if entity_types is None:
+            entity_types = ENTITY_TYPES
+        entity_types = set(entity_types)
+        with self._lock:
+            for entity_type in entity_types:
+                self._generations[entity_type] += 1
+            for cache_key in [k for k in self._entries
+                              if k[0] in entity_types]:
+                del self._entries[cache_key]
+            self._stats['invalidations'] += 1
+
+    def apply_changes(self, changes, snapshot):
+        """
+        Update cached results in place from a sync ChangeSet
+
+        Cached lists of a changed type are replaced, cached single entities
+        that were changed or removed are replaced or set to None, and every
+        other entry is left alone.
+
+        :param changes: ChangeSet
+        :param snapshot: Snapshot the change set was computed for
+        """
+        now = time.time()
+        with self._lock:
+            for entity_type in changes.entity_types():
+                if entity_type not in self._generations:
+                    continue
+                # results fetched before this change must not be stored
+                self._generations[entity_type] += 1
+                touched = changes.names(entity_type)
+                for cache_key in [k for k in self._entries
+                                  if k[0] == entity_type]:
+                    method, args, kwargs = cache_key[1]
+                    if method.startswith('list'):
+                        value = snapshot.list(entity_type)
+                    else:
+                        # get calls take the entity name as their only
+                        # argument, either positional or by keyword
+                        if args:
+                            name = args[0]
+                        elif len(kwargs) == 1:
+                            name = kwargs[0][1]
+                        else:
+                            continue
+                        if name not in touched:
+                            continue
+                        value = snapshot.get(entity_type, name)
+                    self._versions += 1
+                    self._entries[cache_key] = (
+                        now + self.ttl[entity_type], value, self._versions)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'entries': len(self._entries),
+                          'max_entries': self.max_entries})
+        return stats
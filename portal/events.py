@@ -0,0 +1,201 @@
+"""
+Push virtual cluster and allocation status changes to browsers.
+
+Status pages used to poll ``/rest/*`` every few seconds per entity, whether
+or not anything changed.  ``StatusBroker`` instead keeps one watcher per
+entity that is being viewed.  Watchers are updated from the change sets of
+the background snapshot, so they cost the infoservice nothing, and every
+status that actually changed is pushed to the subscriptions of that entity,
+which ``/rest/events`` streams to the browser as Server-Sent Events.
+
+Every open stream holds a server worker, so events are only served when
+``VC3_EVENTS`` is set, on a threaded server.  Streams wait without a
+timeout, which on Python 2 would poll, and one keepalive thread that
+sleeps between ticks wakes them all instead.
+"""
+import collections
+import threading
+import time
+
+from portal.serializers import ALLOCATION, VIRTUAL_CLUSTER
+
+#: Kinds of status that can be watched, and the entity type of each
+STATUS_KINDS = {'virtual_clusters': 'request',
+                'allocations': 'allocation'}
+
+
+class Subscription(object):
+    """
+    Pending status updates of one event stream
+
+    Updates of the same entity are coalesced, so a slow client only ever
+    receives the latest status and never falls behind.
+    """
+
+    def __init__(self, kind, names):
+        self.kind = kind
+        self.names = names
+        self._cond = threading.Condition()
+        self._pending = collections.OrderedDict()
+        self._woken = False
+
+    def push(self, name, status):
+        with self._cond:
+            self._pending[name] = status
+            self._cond.notify()
+
+    def wake(self):
+        """Make the waiting pop() return, even without updates"""
+        with self._cond:
+            self._woken = True
+            self._cond.notify()
+
+    def pop(self):
+        """
+        Wait for status updates, or the next keepalive tick
+
+        :return: list of (name, status) tuples, empty on a tick
+        """
+        with self._cond:
+            while not self._pending and not self._woken:
+                self._cond.wait()
+            self._woken = False
+            updates = list(self._pending.items())
+            self._pending.clear()
+        return updates
+
+
+class StatusWatcher(object):
+    """Last known status of one entity and the subscriptions watching it"""
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.status = None
+        self.subscriptions = set()
+
+
+class StatusBroker(object):
+    """
+    Fan status changes of watched entities out to their subscriptions
+
+    :param refresher: SnapshotRefresher whose change sets drive the watchers
+    :param keepalive: seconds between wake ups of the subscriptions
+    """
+
+    def __init__(self, refresher, keepalive=15, logger=None):
+        self._refresher = refresher
+        self.keepalive = keepalive
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._watchers = {}
+        self._subscriptions = set()
+        self._ticker = None
+        refresher.sync.subscribe(self.apply_changes)
+
+    def _tick(self):
+        while True:
+            # time.sleep doesn't poll like a timed wait does on Python 2
+            time.sleep(self.keepalive)
+            with self._lock:
+                subscriptions = list(self._subscriptions)
+            for subscription in subscriptions:
+                subscription.wake()
+
+    def _start_ticker(self):
+        if self._ticker is None:
+            self._ticker = threading.Thread(target=self._tick,
+                                            name='vc3-events-keepalive')
+            self._ticker.daemon = True
+            self._ticker.start()
+
+    @staticmethod
+    def _status(kind, name, snapshot):
+        if kind == 'virtual_clusters':
+            vc = snapshot.get('request', name)
+            if vc is None:
+                return None
+            headnode = None
+            if vc.headnode:
+                headnode = snapshot.get('nodeset', vc.headnode)
+            return VIRTUAL_CLUSTER.serialize(vc, headnode=headnode)
+        allocation = snapshot.get('allocation', name)
+        if allocation is None:
+            return None
+        return ALLOCATION.serialize(allocation)
+
+    def subscribe(self, kind, names):
+        """
+        Watch the status of entities of one kind
+
+        The current status of every entity known to the snapshot is queued
+        right away.
+
+        :param kind: key of STATUS_KINDS
+        :param names: entity names
+        :return: Subscription, pass it to unsubscribe() when done
+        """
+        subscription = Subscription(kind, names)
+        snapshot = self._refresher.snapshot_for(STATUS_KINDS[kind])
+        with self._lock:
+            self._start_ticker()
+            self._subscriptions.add(subscription)
+            for name in names:
+                watcher = self._watchers.get((kind, name))
+                if watcher is None:
+                    watcher = self._watchers[(kind, name)] = StatusWatcher(
+                        kind, name)
+                    if snapshot is not None:
+                        watcher.status = self._status(kind, name, snapshot)
+                watcher.subscriptions.add(subscription)
+                if watcher.status is not None:
+                    subscription.push(name, watcher.status)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            for name in subscription.names:
+                watcher = self._watchers.get((subscription.kind, name))
+                if watcher is None:
+                    continue
+                watcher.subscriptions.discard(subscription)
+                if not watcher.subscriptions:
+                    del self._watchers[(subscription.kind, name)]
+
+    def _affected(self, watcher, changeset):
+        if watcher.kind == 'allocations':
+            return watcher.name in changeset.names('allocation')
+        if watcher.name in changeset.names('request'):
+            return True
+        headnode = watcher.status and watcher.status.get('headnode')
+        return bool(headnode) and headnode in changeset.names('nodeset')
+
+    def apply_changes(self, changeset, snapshot):
+        """
+        Update the watchers of changed entities and notify their
+        subscriptions
+
+        Subscribed to ``SnapshotRefresher.sync``.
+        """
+        with self._lock:
+            watchers = [w for w in self._watchers.values()
+                        if self._affected(w, changeset)]
+        for watcher in watchers:
+            status = self._status(watcher.kind, watcher.name, snapshot)
+            with self._lock:
+                if status is None or status == watcher.status:
+                    continue
+                watcher.status = status
+                subscriptions = list(watcher.subscriptions)
+            for subscription in subscriptions:
+                subscription.push(watcher.name, status)
+
+    def changed_at(self, kind, name):
+        """Time the status of an entity was last seen to change"""
+        return self._refresher.sync.changed_at(STATUS_KINDS[kind], name)
+
+    def stats(self):
+        with self._lock:
+            return {'watchers': len(self._watchers),
+                    'subscriptions': len(self._subscriptions)}
@@ -0,0 +1,102 @@
+"""
+Concurrent fan-out of independent infoservice reads.
+
+Many views issue several independent ``list*`` calls one after the other,
+so their latency is the sum of every round trip.  ``FanOut`` runs such calls
+on a bounded pool of threads and waits for all of them, which brings page
+latency down to roughly that of the slowest call.
+"""
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
+
+def _call_name(fn):
+    fn = getattr(fn, 'func', fn)
+    return getattr(fn, '__name__', repr(fn))
+
+
+class FanOutTimeout(Exception):
+    """A fanned-out call did not complete within its timeout"""
+
+
+class FanOut(object):
+    """
+    Run independent calls concurrently on a bounded thread pool
+
+    Callables obtained from the shared VC3 client capture the current
+    request's memo when they are looked up, so results fetched by the
+    worker threads are still shared with the rest of the request.
+    """
+
+    def __init__(self, processes=8, timeout=30, logger=None):
+        self.processes = processes
+        self.timeout = timeout
+        self.logger = logger
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.processes)
+            return self._pool
+
+    @staticmethod
+    def _invoke(fn):
+        try:
+            return True, fn(), None
+        except Exception:
+            exc_info = sys.exc_info()
+            return False, exc_info[1], ''.join(
+                traceback.format_exception(*exc_info))
+
+    def run(self, *calls, **kwargs):
+        """
+        Call every callable in ``calls`` concurrently
+
+        The first exception raised by a call is re-raised in the calling
+        thread once every call has completed or timed out, so it reaches
+        the application's error handlers as if the call had been made
+        directly.
+
+        :param calls: callables taking no arguments, use functools.partial
+                      to bind arguments
+        :param timeout: seconds to wait for each call, defaults to the
+                        timeout given to the constructor
+        :return: list of results, in the order of ``calls``
+        """
+        timeout = kwargs.pop('timeout', self.timeout)
+        if len(calls) <= 1:
+            return [fn() for fn in calls]
+
+        pool = self._get_pool()
+        started = time.time()
+        pending = [(fn, pool.apply_async(self._invoke, (fn,)))
+                   for fn in calls]
+
+        results = []
+        error = None
+        for fn, async_result in pending:
+            remaining = max(0, started + timeout - time.time())
+            async_result.wait(remaining)
+            if not async_result.ready():
+                error = error or FanOutTimeout(
+                    "{0} did not complete within {1}s".format(
+                        _call_name(fn), timeout))
+                results.append(None)
+                continue
+            ok, result, trace = async_result.get()
+            if not ok:
+                if self.logger:
+                    self.logger.error("Fanned-out call {0} failed:\n"
+                                      "{1}".format(_call_name(fn), trace))
+                error = error or result
+                result = None
+            results.append(result)
+
+        if error is not None:
+            raise error
+        return results
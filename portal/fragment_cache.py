@@ -0,0 +1,153 @@
+"""
+Cached fragments of templates.
+
+The resource, cluster and virtual cluster tables render every row on every
+request, although the entities they show rarely change between two
+requests.  The ``{% cache key, deps %}`` tag keeps the HTML of the section
+it wraps, keyed by the template, the key and the versions of the entity
+types in deps, so the section is only rendered again once one of those
+entity types changed::
+
+    {% cache session['name'], ('cluster', 'nodeset') %}
+      ...
+    {% endcache %}
+
+The key tells apart sections showing different content for the same
+entities, such as the rows of the logged in user.  Versions come from the
+VC3 client's ``list_version``; when one is unknown the section is rendered
+without being cached.  Fragments of changed types are dropped as soon as
+the snapshot sees the change, stale ones would never be looked up again.
+"""
+import collections
+import threading
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class FragmentCache(object):
+    """
+    Rendered template fragments, keyed by entity type versions
+
+    :param version_of: function returning the hashable version of an
+                       entity type, or None if unknown
+    :param max_entries: number of fragments kept, none if 0
+    """
+
+    def __init__(self, version_of, max_entries=256):
+        self.version_of = version_of
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._fragments = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._uncacheable = 0
+
+    def key(self, fragment, key, deps):
+        """
+        Key of a fragment at the current versions of its entity types
+
+        :return: hashable key, or None if some version is unknown
+        """
+        versions = []
+        for entity_type in deps:
+            version = self.version_of(entity_type)
+            if version is None:
+                return None
+            versions.append(version)
+        return fragment, key, tuple(deps), tuple(versions)
+
+    def render(self, fragment, key, deps, caller):
+        """HTML of a fragment, rendered by caller only if it isn't cached"""
+        if isinstance(deps, string_types):
+            deps = (deps,)
+        cache_key = self.key(fragment, key, deps) if self.max_entries else None
+        if cache_key is None:
+            self._uncacheable += 1
+            return caller()
+        with self._lock:
+            html = self._fragments.pop(cache_key, None)
+            if html is not None:
+                self._fragments[cache_key] = html
+                self._hits += 1
+                return html
+            self._misses += 1
+        html = caller()
+        with self._lock:
+            self._fragments[cache_key] = html
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return html
+
+    def apply_changes(self, changes, snapshot):
+        """
+        Drop the fragments of entity types a sync ChangeSet touched
+
+        :param changes: ChangeSet
+        :param snapshot: Snapshot the change set was computed for
+        """
+        changed = set(changes.entity_types())
+        if not changed:
+            return
+        with self._lock:
+            for cache_key in [k for k in self._fragments
+                              if changed.intersection(k[2])]:
+                del self._fragments[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._fragments), 'hits': self._hits,
+                    'misses': self._misses,
+                    'uncacheable': self._uncacheable,
+                    'max_entries': self.max_entries}
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension adding the ``{% cache key, deps %}`` tag"""
+
+    tags = set(['cache'])
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # the template and line tell apart the sections using the same key
+        fragment = nodes.Const('%s:%d' % (parser.name, lineno))
+        key = parser.parse_expression()
+        parser.stream.expect('comma')
+        deps = parser.parse_expression()
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache', [fragment, key, deps]),
+            [], [], body).set_lineno(lineno)
+
+    def _cache(self, fragment, key, deps, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return cache.render(fragment, key, deps, caller)
+
+
+def init_app(app, version_of):
+    """
+    Add the ``cache`` tag to the templates of an application
+
+    :param version_of: function returning the version of an entity type
+    :return: the FragmentCache
+    """
+    cache = FragmentCache(
+        version_of, max_entries=app.config.get('VC3_FRAGMENT_CACHE_SIZE', 256))
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = cache
+    return cache
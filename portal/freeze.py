@@ -0,0 +1,205 @@
+"""
+Static build of the public pages.
+
+The ``freeze`` command renders the pages anyone can see without logging in,
+the landing pages and every blog page, to HTML files in
+``FREEZER_DESTINATION`` so a front-end server can serve them without going
+through the portal.  Pages are rendered in parallel worker processes, and
+only when their inputs, the templates, the built asset and image manifests
+and the blog pages they show, changed since the last build.
+
+Every page is written as an ``index.html`` in the directory of its URL path,
+``/blog`` as ``blog/index.html`` next to the articles in ``blog/``.  Query
+strings can't be frozen: only the first page of each article list is
+built, and requests for other pages still need to reach the portal.
+Article lists also show the archive sidebar and their number of pages,
+so they are rebuilt whenever an article is added, removed or moved to
+another tag or month, not only when the articles they show change.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+
+import click
+from flask import url_for
+
+#: Endpoints of the public pages that don't show blog pages
+STATIC_ENDPOINTS = ('home', 'team', 'community', 'documentations')
+#: Endpoints of the article lists
+LIST_ENDPOINTS = ('blog', 'tag', 'archive')
+#: Name of the file recording the inputs of the last build
+MANIFEST = '.freeze-manifest.json'
+
+#: Flask application worker processes render with, inherited when the pool
+#: forks
+_worker_app = None
+
+
+def public_pages(blog_index, per_page=10):
+    """
+    Public pages and the blog pages each of them shows
+
+    :param per_page: number of articles on a page of an article list
+    :return: iterable of (endpoint, values, blog pages) tuples
+    """
+    for endpoint in STATIC_ENDPOINTS:
+        yield endpoint, {}, []
+    yield 'blog', {}, blog_index.latest(1, per_page).items
+    for tag, _ in blog_index.tags():
+        yield 'tag', {'tag': tag}, blog_index.tagged(tag, 1, per_page).items
+    for (year, month), _ in blog_index.months():
+        yield ('archive', {'year': year, 'month': month},
+               blog_index.archive(year, month, 1, per_page).items)
+    # every blog page has a URL, articles and pages without a date alike
+    for page in sorted(blog_index.pages, key=lambda p: p.path):
+        yield 'page', {'path': page.path}, [page]
+
+
+def _hash_files(digest, directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            digest.update(os.path.relpath(path, directory).encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+
+
+def common_inputs(app):
+    """Hash of the inputs every public page depends on"""
+    digest = hashlib.sha1()
+    _hash_files(digest, os.path.join(app.root_path, app.template_folder))
+    for manifest in (('dist', 'manifest.json'),
+                     ('dist', 'img', 'manifest.json')):
+        path = os.path.join(app.static_folder, *manifest)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def list_inputs(common, blog_index, per_page):
+    """
+    Hash of the inputs every article list depends on: the months and tags
+    with their number of articles, the sidebar and pagers show them
+    """
+    digest = hashlib.sha1(common.encode('utf-8'))
+    digest.update(json.dumps([len(blog_index.articles), per_page,
+                              blog_index.months(), blog_index.tags()],
+                             default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def page_inputs(common, blog_pages):
+    """Hash of the inputs of a page showing blog_pages"""
+    digest = hashlib.sha1(common.encode('utf-8'))
+    for page in blog_pages:
+        digest.update(json.dumps([page.path, page.meta, page.body],
+                                 sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def url_to_filepath(url):
+    """Path of the file a URL path is frozen to, relative to the build"""
+    return url.strip('/') + '/index.html' if url != '/' else 'index.html'
+
+
+def _render(url):
+    with _worker_app.test_client() as client:
+        response = client.get(url)
+        return url, response.status_code, response.get_data()
+
+
+def freeze(app, freezer, blog_index, workers=None, force=False):
+    """
+    Build the public pages whose inputs changed since the last build
+
+    :param workers: number of worker processes, one per CPU if None
+    :param force: build every page
+    :return: (built, unchanged, removed) lists of URLs
+    """
+    global _worker_app
+    common = common_inputs(app)
+    per_page = app.config.get('VC3_BLOG_PAGE_SIZE', 10)
+    lists = list_inputs(common, blog_index, per_page)
+    inputs = {}
+    with app.test_request_context():
+        for endpoint, values, blog_pages in public_pages(blog_index,
+                                                         per_page):
+            base = lists if endpoint in LIST_ENDPOINTS else common
+            inputs[url_for(endpoint, **values)] = page_inputs(base,
+                                                              blog_pages)
+
+    root = freezer.root
+    manifest_path = os.path.join(root, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    except (IOError, ValueError):
+        previous = {}
+
+    def destination(url):
+        return os.path.join(root, *url_to_filepath(url).split('/'))
+
+    stale = sorted(url for url, fingerprint in inputs.items()
+                   if force or previous.get(url) != fingerprint or
+                   not os.path.isfile(destination(url)))
+    unchanged = sorted(set(inputs) - set(stale))
+    removed = sorted(set(previous) - set(inputs))
+
+    built = []
+    if stale:
+        _worker_app = app
+        pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+        try:
+            for url, status, data in pool.imap_unordered(_render, stale):
+                if status != 200:
+                    raise click.ClickException(
+                        'Unexpected status {0} on URL {1}'.format(status, url))
+                path = destination(url)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path, 'wb') as f:
+                    f.write(data)
+                built.append(url)
+        finally:
+            pool.close()
+            pool.join()
+            _worker_app = None
+
+    for url in removed:
+        try:
+            os.remove(destination(url))
+            # and the directories that only held it
+            os.removedirs(os.path.dirname(destination(url)))
+        except OSError:
+            pass
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(inputs, f, indent=2, sort_keys=True)
+    os.rename(manifest_path + '.tmp', manifest_path)
+    return sorted(built), unchanged, removed
+
+
+def init_app(app, freezer, blog_index):
+    """Register the public page generator and the freeze command"""
+
+    @freezer.register_generator
+    def public_urls():
+        per_page = app.config.get('VC3_BLOG_PAGE_SIZE', 10)
+        for endpoint, values, _ in public_pages(blog_index, per_page):
+            yield endpoint, values
+
+    @app.cli.command('freeze')
+    @click.option('--workers', type=int,
+                  help='Number of worker processes, one per CPU by default.')
+    @click.option('--force', is_flag=True,
+                  help='Build pages whose inputs did not change.')
+    def freeze_command(workers, force):
+        """Build static HTML of the public pages."""
+        built, unchanged, removed = freeze(app, freezer, blog_index,
+                                           workers, force)
+        for url in built:
+            click.echo(url)
+        click.echo('{0} built, {1} unchanged, {2} removed, in {3}'.format(
+            len(built), len(unchanged), len(removed), freezer.root))
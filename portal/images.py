@@ -0,0 +1,195 @@
+"""
+Responsive image variants.
+
+The diagrams, illustrations and logos in ``static/img`` are much larger than
+most screens show them.  The ``build-images`` command writes WebP variants
+of every image at several widths, and smaller variants in the original
+format for browsers without WebP, to ``static/dist/img``.  Variant names
+carry a hash of their source, so a rebuild only resizes images that changed
+and the variants are served with the immutable caching of the fingerprinted
+assets.  The ``picture`` macro in ``_images.html`` links them with
+``srcset`` and falls back to the plain image until they are built.
+
+Building the variants requires the optional ``Pillow`` module.
+"""
+import hashlib
+import json
+import os
+
+import click
+from flask import url_for
+
+from portal.assets import DIST
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+#: Widths of the variants written for every image, in pixels; images are
+#: never scaled up
+WIDTHS = (320, 640, 960, 1280)
+#: Extensions of the images variants are written for
+EXTENSIONS = ('.png', '.jpg', '.jpeg')
+#: Directories of the static folder holding images without variants
+SKIPPED = ('img/favicons',)
+
+_SAVE_OPTIONS = {
+    'WEBP': {'quality': 80, 'method': 6},
+    'PNG': {'optimize': True},
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+
+def _manifest_path(static_folder):
+    return os.path.join(static_folder, DIST, 'img', 'manifest.json')
+
+
+def load_manifest(static_folder):
+    """Manifest written by the last build, empty if there was none"""
+    try:
+        with open(_manifest_path(static_folder)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def source_images(static_folder):
+    """Static filenames of the images variants are written for"""
+    for root, dirs, files in os.walk(os.path.join(static_folder, 'img')):
+        relative = os.path.relpath(root, static_folder).replace(os.sep, '/')
+        if relative in SKIPPED:
+            dirs[:] = []
+            continue
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() in EXTENSIONS:
+                yield '%s/%s' % (relative, filename)
+
+
+def _save(image, static_folder, filename, image_format, force=False):
+    path = os.path.join(static_folder, filename)
+    if not force and os.path.exists(path):
+        return False
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path + '.tmp', 'wb') as f:
+        image.save(f, image_format, **_SAVE_OPTIONS[image_format])
+    os.rename(path + '.tmp', path)
+    return True
+
+
+def build_variants(static_folder, filename, digest, widths=WIDTHS,
+                   force=False):
+    """
+    Write the variants of one image
+
+    :param filename: static filename of the source image
+    :param digest: hash of the source image, part of the variant names
+    :param force: overwrite variants that were written before
+    :return: manifest entry of the image and the number of files written
+    """
+    source = Image.open(os.path.join(static_folder, filename))
+    source.load()
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert(
+            'RGBA' if 'transparency' in source.info or
+            source.mode in ('LA', 'P') else 'RGB')
+    width, height = source.size
+    stem, ext = os.path.splitext(filename)
+    image_format = 'JPEG' if ext.lower() in ('.jpg', '.jpeg') else 'PNG'
+    if image_format == 'JPEG' and source.mode == 'RGBA':
+        source = source.convert('RGB')
+
+    entry = {'sha1': digest, 'width': width, 'height': height,
+             'webp': [], 'fallback': []}
+    written = 0
+    for w in sorted(set(w for w in widths if w < width) | set([width])):
+        if w == width:
+            variant = source
+        else:
+            variant = source.resize((w, max(1, height * w // width)),
+                                    Image.LANCZOS)
+        name = '%s/%s.%s-%dw' % (DIST, stem, digest[:12], w)
+        written += _save(variant, static_folder, name + '.webp', 'WEBP',
+                         force)
+        entry['webp'].append([w, name + '.webp'])
+        if w == width:
+            entry['fallback'].append([w, filename])
+        else:
+            written += _save(variant, static_folder, name + ext,
+                             image_format, force)
+            entry['fallback'].append([w, name + ext])
+    return entry, written
+
+
+def build_images(static_folder, widths=WIDTHS, force=False):
+    """
+    Write the variants of every image whose source changed
+
+    :param force: rewrite the variants of unchanged images
+    :return: manifest mapping static filenames to their variants, and the
+             number of files written
+    """
+    previous = load_manifest(static_folder)
+    manifest = {}
+    written = 0
+    for filename in source_images(static_folder):
+        with open(os.path.join(static_folder, filename), 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        entry = previous.get(filename)
+        if (not force and entry is not None and entry['sha1'] == digest and
+                all(os.path.exists(os.path.join(static_folder, name))
+                    for _, name in entry['webp'] + entry['fallback'])):
+            manifest[filename] = entry
+            continue
+        manifest[filename], count = build_variants(
+            static_folder, filename, digest, widths, force)
+        written += count
+    path = _manifest_path(static_folder)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.rename(path + '.tmp', path)
+    return manifest, written
+
+
+def _srcset(variants):
+    return ', '.join('%s %dw' % (url_for('static', filename=name), w)
+                     for w, name in variants)
+
+
+def init_app(app):
+    """Link and build the responsive image variants"""
+    manifest = load_manifest(app.static_folder)
+
+    def responsive_image(filename):
+        """
+        srcset attributes of an image's variants
+
+        :param filename: static filename of the image
+        :return: dict with the 'webp' and 'fallback' srcsets, or None if the
+                 variants weren't built
+        """
+        entry = manifest.get(filename)
+        if entry is None:
+            return None
+        return {'webp': _srcset(entry['webp']),
+                'fallback': _srcset(entry['fallback'])}
+
+    app.jinja_env.globals['responsive_image'] = responsive_image
+
+    @app.cli.command('build-images')
+    @click.option('--force', is_flag=True,
+                  help='Rewrite the variants of unchanged images.')
+    def build_images_command(force):
+        """Write resized and WebP variants of the static images."""
+        if Image is None:
+            raise click.ClickException('building image variants requires '
+                                       'Pillow')
+        widths = app.config.get('VC3_IMAGE_WIDTHS', WIDTHS)
+        built, written = build_images(app.static_folder, widths, force)
+        manifest.clear()
+        manifest.update(built)
+        click.echo('%d images, %d variants written' % (len(built), written))
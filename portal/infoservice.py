@@ -0,0 +1,363 @@
+"""
+Shared access to the VC3 infoservice client.
+
+The portal used to parse ``VC3_CLIENT_CONFIG`` and build a new
+``VC3ClientAPI`` for every call to ``get_vc3_client()``.  The classes here
+parse the configuration once, keep a bounded pool of client instances that
+are shared by every request and worker thread, and rebuild the pool when the
+configuration file changes on disk.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from vc3client import client
+
+from portal.catalog import GET_METHODS, LIST_METHODS
+from portal.entity_cache import read_entity_type, written_entity_types
+from portal.lazy import lazy_stats
+from portal.request_cache import current_memo, memo_stats
+from portal.singleflight import call_label
+
+try:
+    from ConfigParser import SafeConfigParser
+except ImportError:
+    from configparser import ConfigParser as SafeConfigParser
+
+
+class VC3ClientPool(object):
+    """
+    Thread-safe pool of VC3ClientAPI instances
+
+    Clients are created lazily, up to ``size`` of them, and handed back to
+    the pool after every call so that the connections they hold are reused.
+    The configuration file's mtime is checked at most once every
+    ``reload_interval`` seconds; when it changes the configuration is parsed
+    again and clients built from the old configuration are discarded.
+    """
+
+    def __init__(self, config_path, size=8, reload_interval=5, logger=None):
+        self.config_path = config_path
+        self.size = size
+        self.reload_interval = reload_interval
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []
+        self._in_use = 0
+        self._config = None
+        self._mtime = None
+        self._checked_at = 0
+        self._generation = 0
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0,
+                       'reloads': 0, 'waits': 0, 'errors': 0}
+
+    def _refresh_config(self):
+        """
+        Parse the client configuration if it is new or has changed
+
+        Must be called with the pool lock held.
+        """
+        now = time.time()
+        if (self._config is not None and
+                now - self._checked_at < self.reload_interval):
+            return
+        self._checked_at = now
+
+        mtime = os.path.getmtime(self.config_path)
+        if mtime == self._mtime:
+            return
+
+        parser = SafeConfigParser()
+        with open(self.config_path) as fh:
+            parser.readfp(fh)
+
+        if self._config is not None:
+            self._stats['reloads'] += 1
+            if self.logger:
+                self.logger.info("VC3 client configuration changed, "
+                                 "rebuilding client pool")
+        self._stats['discarded'] += len(self._idle)
+        self._idle = []
+        self._config = parser
+        self._mtime = mtime
+        self._generation += 1
+
+    def acquire(self):
+        """
+        Check a client out of the pool, creating one if there is room
+
+        :return: tuple of (generation, VC3ClientAPI instance)
+        """
+        with self._lock:
+            self._refresh_config()
+            while not self._idle and self._in_use >= self.size:
+                self._stats['waits'] += 1
+                self._available.wait()
+                self._refresh_config()
+            self._in_use += 1
+            generation = self._generation
+            if self._idle:
+                self._stats['reused'] += 1
+                return generation, self._idle.pop()
+            config = self._config
+
+        try:
+            client_api = client.VC3ClientAPI(config)
+        except Exception as e:
+            with self._lock:
+                self._in_use -= 1
+                self._stats['errors'] += 1
+                self._available.notify()
+            if self.logger:
+                self.logger.error("Couldn't get vc3 client: {0}".format(e))
+            raise
+
+        with self._lock:
+            self._stats['created'] += 1
+        return generation, client_api
+
+    def release(self, generation, client_api):
+        """
+        Return a client to the pool
+
+        Clients built from an outdated configuration are dropped.
+        """
+        with self._lock:
+            self._in_use -= 1
+            if generation == self._generation:
+                self._idle.append(client_api)
+            else:
+                self._stats['discarded'] += 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a client for the duration of a ``with`` block"""
+        generation, client_api = self.acquire()
+        try:
+            yield client_api
+        finally:
+            self.release(generation, client_api)
+
+    def stats(self):
+        """
+        Report pool usage
+
+        :return: dict of pool size, usage and lifetime counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'size': self.size,
+                          'idle': len(self._idle),
+                          'in_use': self._in_use,
+                          'generation': self._generation,
+                          'config_mtime': self._mtime})
+        return stats
+
+
+#: Method name prefixes of VC3ClientAPI calls that only read from the
+#: infoservice and of calls that modify it.
+READ_PREFIXES = ('list', 'get')
+WRITE_PREFIXES = ('store', 'delete', 'add', 'remove', 'terminate')
+
+
+class PooledVC3Client(object):
+    """
+    Stand-in for VC3ClientAPI backed by a VC3ClientPool
+
+    Every method call borrows a client from the pool and returns it as soon
+    as the call completes, so a single instance can be shared freely between
+    threads.  Reads are memoized for the duration of the current request and,
+    when a SnapshotRefresher or an EntityCache is given, served from the
+    background snapshot or shared across requests; every read of a request
+    comes from the same snapshot.  With a SingleFlight, identical concurrent
+    reads that miss both share one backend call.  Any write made through the
+    client discards the request's memo, invalidates the entity types it
+    modifies and stops them being served from the snapshot until it is
+    refreshed.
+    """
+
+    def __init__(self, pool, cache=None, snapshot=None, single_flight=None):
+        self._pool = pool
+        self._cache = cache
+        self._snapshot = snapshot
+        self._single_flight = single_flight
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        # Resolve the request memo here, in the caller's thread, so that
+        # the returned callable can be handed to other threads.
+        memo = current_memo()
+        if name.startswith(READ_PREFIXES):
+            def call(*args, **kwargs):
+                return self._read(memo, name, args, kwargs)
+        elif name.startswith(WRITE_PREFIXES):
+            def call(*args, **kwargs):
+                return self._write(memo, name, args, kwargs)
+        else:
+            def call(*args, **kwargs):
+                return self._call(name, args, kwargs)
+        call.__name__ = name
+        return call
+
+    def _call(self, name, args, kwargs):
+        with self._pool.connection() as client_api:
+            return getattr(client_api, name)(*args, **kwargs)
+
+    def _read(self, memo, name, args, kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # unhashable arguments, don't memoize
+            return self._call(name, args, kwargs)
+
+        if memo is None:
+            return self._cached_call(memo, key, name, args, kwargs)
+        found, result = memo.lookup(key)
+        if not found:
+            result = self._cached_call(memo, key, name, args, kwargs)
+            memo.store(key, result)
+        return result
+
+    def _from_snapshot(self, memo, entity_type, name, args, kwargs):
+        snapshot = self._snapshot.snapshot_for(entity_type)
+        if snapshot is None:
+            return False, None
+        if memo is not None:
+            snapshot = memo.pin_snapshot(snapshot)
+
+        if name == LIST_METHODS.get(entity_type) and not args and not kwargs:
+            result = snapshot.list(entity_type)
+            if memo is not None:
+                memo.list_versions[entity_type] = (
+                    'snapshot', snapshot.type_version(entity_type))
+        elif (name == GET_METHODS[entity_type][0] and
+                len(args) + len(kwargs) == 1):
+            argument = GET_METHODS[entity_type][1]
+            entity_name = args[0] if args else kwargs.get(argument)
+            result = snapshot.get(entity_type, entity_name)
+            if result is None:
+                # possibly created since the snapshot was taken
+                return False, None
+        else:
+            return False, None
+
+        if memo is not None:
+            memo.snapshot_version = snapshot.version
+            memo.snapshot_stale = self._snapshot.stale
+        return True, result
+
+    def _cached_call(self, memo, key, name, args, kwargs):
+        entity_type = read_entity_type(name)
+        if entity_type is None:
+            return self._shared_call(key, name, args, kwargs)
+        if self._snapshot is not None:
+            found, result = self._from_snapshot(memo, entity_type, name,
+                                                args, kwargs)
+            if found:
+                return result
+        if self._cache is None:
+            return self._shared_call(key, name, args, kwargs)
+        found, result, version = self._cache.get_versioned(entity_type, key)
+        if not found:
+            generation = self._cache.generation(entity_type)
+            # don't join calls started before a write
+            result = self._shared_call((key, generation), name, args, kwargs)
+            version = self._cache.put(entity_type, key, result, generation)
+        if memo is not None and key == (LIST_METHODS.get(entity_type), (),
+                                        ()):
+            # the memoized list keeps its version, even once the cache
+            # moved on; None if it wasn't cached
+            memo.list_versions[entity_type] = (
+                ('cache', version) if version is not None else None)
+        return result
+
+    def _shared_call(self, key, name, args, kwargs):
+        # identical concurrent reads wait for a single backend call
+        if self._single_flight is None:
+            return self._call(name, args, kwargs)
+        return self._single_flight.do(
+            key, lambda: self._call(name, args, kwargs),
+            label=call_label(name, args, kwargs))
+
+    def _write(self, memo, name, args, kwargs):
+        try:
+            return self._call(name, args, kwargs)
+        finally:
+            entity_types = written_entity_types(name)
+            if self._snapshot is not None:
+                self._snapshot.mark_dirty(entity_types)
+            if self._cache is not None:
+                self._cache.invalidate(entity_types)
+            if memo is not None:
+                memo.clear()
+
+    def get_many(self, entity_type, names):
+        """
+        Fetch several entities of one type with a single list call
+
+        Types the infoservice can't list, such as nodeinfo, are fetched
+        with one get call per distinct name instead; those calls are served
+        by the request memo and the entity cache whenever possible.
+
+        :param entity_type: entity type, e.g. 'nodeset'
+        :param names: iterable of entity names
+        :return: dict of name to entity for every name that exists
+        """
+        names = set(n for n in names if n)
+        if not names:
+            return {}
+        if entity_type not in LIST_METHODS:
+            method, argument = GET_METHODS[entity_type]
+            getter = getattr(self, method)
+            entities = [getter(**{argument: n}) for n in names]
+            return dict((e.name, e) for e in entities if e is not None)
+        entities = getattr(self, LIST_METHODS[entity_type])()
+        return dict((e.name, e) for e in entities if e.name in names)
+
+    def list_version(self, entity_type):
+        """
+        Version of the list of every entity of a type
+
+        Structures derived from the list, such as catalog indexes, can be
+        reused for as long as its version stays the same.  Once the current
+        request read the list, this is the version of the list it read.
+
+        :return: hashable version, or None if the list is neither in the
+                 snapshot nor in the entity cache, as for types that can't
+                 be listed outside the snapshot
+        """
+        memo = current_memo()
+        if memo is not None and entity_type in memo.list_versions:
+            return memo.list_versions[entity_type]
+        if self._snapshot is not None:
+            snapshot = self._snapshot.snapshot_for(entity_type)
+            if snapshot is not None:
+                if memo is not None:
+                    snapshot = memo.pin_snapshot(snapshot)
+                return ('snapshot', snapshot.type_version(entity_type))
+        if self._cache is not None and entity_type in LIST_METHODS:
+            key = (LIST_METHODS[entity_type], (), ())
+            version = self._cache.version(entity_type, key)
+            if version is not None:
+                return ('cache', version)
+        return None
+
+    def stats(self):
+        """Statistics for the client pool, caches and snapshot"""
+        stats = {'pool': self._pool.stats(),
+                 'request_memo': memo_stats.as_dict(),
+                 'lazy_lists': lazy_stats.as_dict()}
+        if self._cache is not None:
+            stats['entity_cache'] = self._cache.stats()
+        if self._snapshot is not None:
+            stats['snapshot'] = self._snapshot.status()
+        if self._single_flight is not None:
+            stats['single_flight'] = self._single_flight.stats()
+        return stats
@@ -0,0 +1,110 @@
+"""
+Lazy entity lists for view and template context.
+
+Views used to fetch every list a template might need, and many of those
+lists were never rendered.  ``lazy_list()`` returns a list-like proxy that
+only calls the infoservice the first time it is iterated, measured or
+indexed.  Lists that were never used are logged when the request ends.
+"""
+import threading
+
+from flask import g, has_app_context
+
+
+class LazyList(object):
+    """List-like proxy that fetches its items on first use"""
+
+    def __init__(self, fetch, args=(), kwargs=None, name=None):
+        self._fetch = fetch
+        self._args = args
+        self._kwargs = kwargs or {}
+        self._lock = threading.Lock()
+        self._items = None
+        self.name = name or getattr(fetch, '__name__', repr(fetch))
+
+    @property
+    def consumed(self):
+        return self._items is not None
+
+    def _resolve(self):
+        if self._items is None:
+            with self._lock:
+                if self._items is None:
+                    self._items = list(self._fetch(*self._args,
+                                                   **self._kwargs))
+        return self._items
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __getitem__(self, index):
+        return self._resolve()[index]
+
+    def __contains__(self, item):
+        return item in self._resolve()
+
+    def __reversed__(self):
+        return reversed(self._resolve())
+
+    def __nonzero__(self):
+        return bool(self._resolve())
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        if self._items is None:
+            return '<LazyList {0} (not fetched)>'.format(self.name)
+        return repr(self._items)
+
+
+class LazyListStats(object):
+    """Running totals of lazy lists created and never fetched"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.dropped = 0
+
+    def record(self, lazy_lists):
+        dropped = len([l for l in lazy_lists if not l.consumed])
+        with self._lock:
+            self.created += len(lazy_lists)
+            self.dropped += dropped
+
+    def as_dict(self):
+        with self._lock:
+            return {'created': self.created, 'dropped': self.dropped}
+
+
+lazy_stats = LazyListStats()
+
+
+def lazy_list(fetch, *args, **kwargs):
+    """
+    Defer a list fetch until its result is used
+
+    :param fetch: callable returning a list, e.g. vc3_client.listUsers
+    :return: LazyList instance
+    """
+    lazy = LazyList(fetch, args, kwargs)
+    if has_app_context():
+        if not hasattr(g, '_vc3_lazy_lists'):
+            g._vc3_lazy_lists = []
+        g._vc3_lazy_lists.append(lazy)
+    return lazy
+
+
+def init_app(app):
+    """Log the lazy lists each request never used"""
+    @app.teardown_request
+    def record_lazy_lists(exc):
+        lazy_lists = getattr(g, '_vc3_lazy_lists', None)
+        if not lazy_lists:
+            return
+        lazy_stats.record(lazy_lists)
+        unused = [l.name for l in lazy_lists if not l.consumed]
+        if unused:
+            app.logger.debug("Skipped unused infoservice fetches: "
+                             "{0}".format(', '.join(unused)))
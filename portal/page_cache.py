@@ -0,0 +1,364 @@
+"""
+Rendered HTML of the blog pages.
+
+Blog pages are Markdown files updated in place by an external pull script.
+FlatPages rendered each page's Markdown the first time it was shown after
+every load, and only reloaded pages in debug mode.
+
+``RenderedPageCache`` is installed as the FlatPages HTML renderer: it keeps
+the HTML of every page keyed by a hash of its body, in memory and in a
+directory on disk, so unchanged pages are never rendered again, not even
+after a restart.  ``PageReloader`` checks the pages directory in a
+background thread.  When files were added, removed or their content changed
+it reloads the pages, which re-parses only the files whose mtime changed,
+and renders the new bodies ahead of time, in a process pool for large
+batches, so no request waits on Markdown.
+
+Renderers may take the body, the body and the FlatPages instance, or those
+and the page, as FlatPages allows.  The HTML of a renderer taking the page
+is also keyed by the page's path and metadata.
+"""
+import atexit
+import collections
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+
+from werkzeug.utils import import_string
+
+try:
+    from inspect import getfullargspec
+except ImportError:
+    from inspect import getargspec as getfullargspec
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+#: Cache, FlatPages instance and pages pre-rendering worker processes use,
+#: inherited when the pool forks
+_prerender_with = None
+
+
+def _prerender(i):
+    cache, flatpages, pages = _prerender_with
+    page = pages[i]
+    return cache.call_renderer(page.body, flatpages, page)
+
+
+def renderer_arguments(renderer):
+    """
+    Number of arguments a FlatPages HTML renderer takes, counted the way
+    FlatPages counts them
+    """
+    try:
+        count = len(getfullargspec(renderer).args)
+    except TypeError:
+        return 1
+    if count not in (1, 2, 3):
+        raise ValueError('HTML renderer {0!r} takes {1} arguments, FlatPages '
+                         'renderers take 1 to 3'.format(renderer, count))
+    return count
+
+
+class RenderedPageCache(object):
+    """
+    HTML of rendered page bodies, keyed by a hash of the body
+
+    :param renderer: FlatPages HTML renderer, callable or import string,
+                     taking the body and optionally the FlatPages instance
+                     and the page
+    :param directory: directory the HTML is also stored in, memory only if
+                      None
+    :param max_entries: number of rendered pages kept in memory
+    """
+
+    def __init__(self, renderer, directory=None, max_entries=1024):
+        if not callable(renderer):
+            renderer = import_string(renderer)
+        self.renderer = renderer
+        self.arguments = renderer_arguments(renderer)
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._html = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, body, flatpages, page=None):
+        """
+        Hash of a body and of the settings it is rendered with, and of the
+        page's path and metadata if the renderer takes the page
+        """
+        renderer = self.renderer
+        settings = repr((getattr(renderer, '__module__', None),
+                         getattr(renderer, '__name__', repr(renderer)),
+                         flatpages.config('markdown_extensions'),
+                         flatpages.config('extension_configs')))
+        digest = hashlib.sha1(settings.encode('utf-8'))
+        digest.update(body.encode('utf-8'))
+        if self.arguments == 3 and page is not None:
+            page_source = u'\0{0}\0{1}'.format(page.path, page._meta)
+            digest.update(page_source.encode('utf-8'))
+        return digest.hexdigest()
+
+    def call_renderer(self, body, flatpages, page=None):
+        """HTML of a body from the renderer, with the arguments it takes"""
+        if self.arguments == 1:
+            return self.renderer(body)
+        if self.arguments == 2:
+            return self.renderer(body, flatpages)
+        return self.renderer(body, flatpages, page)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.html')
+
+    def get(self, key):
+        """Rendered HTML stored under a key, or None"""
+        with self._lock:
+            html = self._html.pop(key, None)
+            if html is not None:
+                self._html[key] = html
+                return html
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    html = f.read().decode('utf-8')
+            except IOError:
+                return None
+            self._remember(key, html)
+        return html
+
+    def _remember(self, key, html):
+        with self._lock:
+            self._html[key] = html
+            while len(self._html) > self.max_entries:
+                self._html.popitem(last=False)
+
+    def put(self, key, html):
+        """Store rendered HTML under a key"""
+        self._remember(key, html)
+        if self.directory:
+            path = self._path(key)
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(html.encode('utf-8'))
+            os.rename(tmp, path)
+
+    def render(self, body, flatpages, page=None):
+        """HTML of a page body, rendered only if it isn't cached"""
+        key = self.key(body, flatpages, page)
+        html = self.get(key)
+        if html is None:
+            self._misses += 1
+            html = self.call_renderer(body, flatpages, page)
+            self.put(key, html)
+        else:
+            self._hits += 1
+        return html
+
+    def html_renderer(self):
+        """Function to set as ``FLATPAGES_HTML_RENDERER``"""
+        # FlatPages counts the arguments of its renderer, which a bound
+        # method would get wrong; it passes the page to this one
+        def render(body, flatpages, page):
+            return self.render(body, flatpages, page)
+        return render
+
+    def prerender(self, pages, flatpages, processes=None, min_batch=20):
+        """
+        Render every page that isn't cached yet
+
+        :param processes: number of worker processes used for batches of at
+                          least min_batch pages, rendered in this thread if
+                          0 or None
+        :return: number of pages rendered
+        """
+        global _prerender_with
+        missing = collections.OrderedDict()
+        for page in pages:
+            key = self.key(page.body, flatpages, page)
+            if key not in missing and self.get(key) is None:
+                missing[key] = page
+        if processes and len(missing) >= min_batch:
+            _prerender_with = (self, flatpages, list(missing.values()))
+            pool = multiprocessing.Pool(processes)
+            try:
+                rendered = pool.map(_prerender, range(len(missing)))
+            finally:
+                pool.close()
+                pool.join()
+                _prerender_with = None
+        else:
+            rendered = [self.call_renderer(page.body, flatpages, page)
+                        for page in missing.values()]
+        for key, html in zip(missing, rendered):
+            self.put(key, html)
+        return len(missing)
+
+    def prune(self, keep):
+        """Remove stored HTML of bodies that aren't in keep, a set of keys"""
+        with self._lock:
+            for key in [k for k in self._html if k not in keep]:
+                del self._html[key]
+        if not self.directory:
+            return
+        for filename in os.listdir(self.directory):
+            key, ext = os.path.splitext(filename)
+            if ext == '.html' and key not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._html), 'hits': self._hits,
+                    'misses': self._misses, 'directory': self.directory}
+
+
+class PageReloader(object):
+    """
+    Reload FlatPages in a background thread when their files change
+
+    :param pages: FlatPages instance
+    :param cache: RenderedPageCache installed as its renderer
+    :param interval: seconds between checks of the pages directory
+    :param processes: worker processes used to pre-render large batches
+    """
+
+    def __init__(self, pages, cache, interval=30, processes=None,
+                 logger=None):
+        self.pages = pages
+        self.cache = cache
+        self.interval = interval
+        self.processes = processes
+        self.logger = logger
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._mtimes = {}
+        self._hashes = {}
+        self._reloads = 0
+        self._last_reload = None
+        self._subscribers = []
+
+    def start(self):
+        """Load and render the pages, then keep checking them"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name='vc3-page-reloader')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+
+    def subscribe(self, callback):
+        """
+        Call ``callback(loaded)`` with the dict of loaded pages after every
+        reload
+        """
+        self._subscribers.append(callback)
+
+    def _publish(self, loaded):
+        for callback in list(self._subscribers):
+            try:
+                callback(loaded)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error("Page reload subscriber {0} failed: "
+                                      "{1}".format(callback, e))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error("Reloading pages failed: "
+                                      "{0}".format(e))
+            self._stop.wait(self.interval)
+
+    def _scan(self):
+        extension = self.pages.config('extension')
+        if isinstance(extension, string_types):
+            extension = tuple(extension.split(','))
+        mtimes = {}
+        for root, dirs, files in os.walk(self.pages.root):
+            # the pull script's checkout has a .git directory
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for filename in files:
+                if not filename.endswith(tuple(extension)):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    mtimes[path] = os.path.getmtime(path)
+                except OSError:
+                    pass
+        return mtimes
+
+    def _content_changed(self, mtimes):
+        """Files of the scan whose content changed since the last one"""
+        changed = set(self._mtimes) - set(mtimes)
+        hashes = {}
+        for path, mtime in mtimes.items():
+            if self._mtimes.get(path) == mtime and path in self._hashes:
+                hashes[path] = self._hashes[path]
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    hashes[path] = hashlib.sha1(f.read()).hexdigest()
+            except IOError:
+                continue
+            if hashes[path] != self._hashes.get(path):
+                changed.add(path)
+        self._hashes = hashes
+        return changed
+
+    def check(self):
+        """
+        Reload and render the pages if files were added, removed or changed
+
+        :return: set of the paths of the changed files
+        """
+        mtimes = self._scan()
+        if mtimes == self._mtimes:
+            return set()
+        first = not self._mtimes
+        changed = self._content_changed(mtimes)
+        self._mtimes = mtimes
+        if not changed:
+            return changed
+
+        started = time.time()
+        self.pages.reload()
+        # forget removed files, FlatPages only ever adds to its file cache
+        for filename in list(self.pages._file_cache):
+            if filename not in mtimes:
+                self.pages._file_cache.pop(filename, None)
+        loaded = self.pages._pages
+        rendered = self.cache.prerender(list(loaded.values()), self.pages,
+                                        self.processes)
+        self.cache.prune(set(self.cache.key(page.body, self.pages, page)
+                             for page in loaded.values()))
+        self._publish(loaded)
+        self._reloads += 1
+        self._last_reload = time.time()
+        if self.logger and not first:
+            self.logger.info("Reloaded pages, {0} files changed, {1} "
+                             "rendered in {2:.2f}s".format(
+                                 len(changed), rendered,
+                                 time.time() - started))
+        return changed
+
+    def stats(self):
+        return {'interval': self.interval, 'reloads': self._reloads,
+                'last_reload': self._last_reload, 'files': len(self._mtimes)}
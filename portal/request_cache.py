@@ -0,0 +1,126 @@
+"""
+Per-request memoization of infoservice reads.
+
+A single page view used to fetch the same entity lists several times: once
+in a decorator, again in the view and again in ``portal.utils`` helpers.
+Results of ``list*``/``get*`` calls are kept on ``flask.g`` for the lifetime
+of the request so every caller shares one fetch.
+"""
+import threading
+
+from flask import g, has_app_context
+
+
+class RequestMemo(object):
+    """Results of infoservice reads made during a single request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self.calls = 0
+        self.saved = 0
+        self.snapshot = None
+        self.snapshot_version = None
+        self.snapshot_stale = False
+        # version of each entity list among the results
+        self.list_versions = {}
+
+    def lookup(self, key):
+        """
+        Look up a memoized result
+
+        :return: tuple of (found, result)
+        """
+        with self._lock:
+            self.calls += 1
+            if key in self._results:
+                self.saved += 1
+                return True, self._results[key]
+        return False, None
+
+    def store(self, key, result):
+        with self._lock:
+            self._results[key] = result
+
+    def pin_snapshot(self, snapshot):
+        """
+        Serve the rest of the request from the first snapshot it read
+
+        :return: the pinned Snapshot
+        """
+        with self._lock:
+            if self.snapshot is None:
+                self.snapshot = snapshot
+            return self.snapshot
+
+    def clear(self):
+        """Forget every memoized result, e.g. after a write"""
+        with self._lock:
+            self._results.clear()
+            self.list_versions.clear()
+            self.snapshot = None
+
+
+class RequestMemoStats(object):
+    """Running totals of backend calls saved by request memoization"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.calls = 0
+        self.saved = 0
+
+    def record(self, memo):
+        with self._lock:
+            self.requests += 1
+            self.calls += memo.calls
+            self.saved += memo.saved
+
+    def as_dict(self):
+        with self._lock:
+            return {'requests': self.requests,
+                    'calls': self.calls,
+                    'saved': self.saved}
+
+
+memo_stats = RequestMemoStats()
+
+
+def current_memo():
+    """
+    Return the memo for the current request
+
+    :return: RequestMemo instance, or None outside of an application context
+    """
+    if not has_app_context():
+        return None
+    memo = getattr(g, '_vc3_request_memo', None)
+    if memo is None:
+        memo = g._vc3_request_memo = RequestMemo()
+    return memo
+
+
+def init_app(app):
+    """
+    Record and log how many backend calls each request saved, and tell
+    clients which snapshot, if any, a response was built from
+    """
+    @app.after_request
+    def add_snapshot_headers(response):
+        memo = getattr(g, '_vc3_request_memo', None)
+        if memo is not None and memo.snapshot_version is not None:
+            response.headers['X-VC3-Snapshot-Version'] = str(
+                memo.snapshot_version)
+            if memo.snapshot_stale:
+                response.headers['X-VC3-Snapshot-Stale'] = '1'
+        return response
+
+    @app.teardown_request
+    def record_request_memo(exc):
+        memo = getattr(g, '_vc3_request_memo', None)
+        if memo is None:
+            return
+        memo_stats.record(memo)
+        if memo.saved:
+            app.logger.debug("Request memo saved {0} of {1} infoservice "
+                             "calls".format(memo.saved, memo.calls))
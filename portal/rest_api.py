@@ -1,76 +1,253 @@
 
+import time
+from functools import wraps
+
 import flask
-import base64
-from portal.utils import get_vc3_client
+from portal.utils import get_vc3_client, get_vc3_catalog
+
+from portal import app, get_status_broker
+from portal.decorators import authenticated, conditional
+from portal.events import STATUS_KINDS
+from portal.serializers import ALLOCATION, VIRTUAL_CLUSTER
+from portal.status import StateIntervals, recent_interval, state_interval
+
+#: Serializer of each kind of status, and the entity types it is built from
+SERIALIZERS = {'virtual_clusters': (VIRTUAL_CLUSTER, ('request', 'nodeset')),
+               'allocations': (ALLOCATION, ('allocation',))}
+#: State intervals of recent status responses, see advise_poll_interval
+_state_intervals = StateIntervals()
+
+
+def _query_list(argument):
+    """
+    Values of a query argument, either comma separated or repeated
+    """
+    values = []
+    for value in flask.request.args.getlist(argument):
+        values.extend(v for v in value.split(',') if v)
+    return values
+
+
+def _requested_names():
+    """Entity names given in the ``names`` query argument"""
+    return _query_list('names')
+
+
+def _requested_fields():
+    """
+    Fields given in the ``fields`` query argument, e.g.
+    ?fields=state,statusinfo_running
+
+    :return: list of field names, or None for every field
+    """
+    return _query_list('fields') or None
+
 
-from portal import app
-from portal.decorators import authenticated
+def _statuses(kind, names, fields=None):
+    """
+    Status of every existing entity of a kind among ``names``
+
+    Statuses are cached per version of the entities they are built from,
+    so unchanged entities are neither fetched nor serialized again.
+
+    :param kind: 'virtual_clusters' or 'allocations'
+    :param fields: names of the fields to include, all fields if None
+    :return: dict of name to status
+    """
+    serializer, entity_types = SERIALIZERS[kind]
+    vc3_client = get_vc3_client()
+    version = tuple(vc3_client.list_version(t) for t in entity_types)
+    if None in version:
+        version = None
+    catalog = get_vc3_catalog()
+    result = {}
+    for name in names:
+        status = None
+        if version is not None:
+            status = serializer.cached(name, version, fields)
+        if status is None and kind == 'virtual_clusters':
+            vc = catalog.get('request', 'name', name)
+            if vc is not None:
+                status = serializer.serialize(
+                    vc, version, fields, headnode=catalog.headnode_of(vc))
+        elif status is None:
+            x = catalog.get('allocation', 'name', name)
+            if x is not None:
+                status = serializer.serialize(x, version, fields)
+        if status is not None:
+            result[name] = status
+    return result
+
+
+def advise_poll_interval(kind):
+    """
+    Recommend when to poll again in the X-Poll-Interval header, in seconds
+
+    The interval is the shortest one recommended for the requested
+    entities, given their state and how recently they changed.  The state
+    intervals are kept by ETag, so 304 responses don't build the statuses
+    again.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def decorated_function(*args, **kwargs):
+            response = flask.make_response(fn(*args, **kwargs))
+            if response.status_code not in (200, 304):
+                return response
+            etag = response.get_etag()[0]
+            states = None
+            if response.status_code == 304 and etag:
+                states = _state_intervals.get((kind, etag))
+            if states is None:
+                if 'name' in kwargs:
+                    names = [kwargs['name']]
+                else:
+                    names = _requested_names()
+                states = dict((name, state_interval(status))
+                              for name, status in
+                              _statuses(kind, names).items())
+                if etag:
+                    _state_intervals.put((kind, etag), states)
+            broker = get_status_broker()
+            intervals = []
+            for name, interval in states.items():
+                changed_at = None
+                if broker is not None:
+                    changed_at = broker.changed_at(kind, name)
+                intervals.append(recent_interval(interval, changed_at))
+            if intervals:
+                response.headers['X-Poll-Interval'] = str(min(intervals))
+            return response
+        return decorated_function
+    return decorator
 
 
 @app.route('/rest/virtual_cluster/<name>', methods=['GET'])
 @authenticated
+@advise_poll_interval('virtual_clusters')
+@conditional('request', 'nodeset')
 def virtual_cluster(name):
     """
     Get information for a specified cluster and return
     it in as json or jsonp
 
+    Only the fields named in the ``fields`` argument are returned, if given.
+
     :return: json or jsonp status of cluster
     """
-    result = {}
-    vc3_client = get_vc3_client()
-    virtual_clusters = vc3_client.listRequests()
-    nodesets = vc3_client.listNodesets()
-    for vc in virtual_clusters:
-        if vc.name == name:
-            sanitized_obj = {'name': vc.name,
-                             'state': vc.state,
-                             'cluster': vc.cluster,
-                             'statusraw': vc.statusraw,
-                             'statusinfo': vc.statusinfo,
-                             'displayname': vc.displayname,
-                             'description': vc.description,
-                             'statereason': vc.state_reason,
-                             'action': vc.action,
-                             'headnode': vc.headnode}
-            if vc.statusinfo is not None:
-                sanitized_obj['statusinfo_error'] = vc.statusinfo[vc.cluster]['error']
-                sanitized_obj['statusinfo_idle'] = vc.statusinfo[vc.cluster]['idle']
-                sanitized_obj['statusinfo_node_number'] = vc.statusinfo[vc.cluster]['node_number']
-                sanitized_obj['statusinfo_requested'] = vc.statusinfo[vc.cluster]['requested']
-                sanitized_obj['statusinfo_running'] = vc.statusinfo[vc.cluster]['running']
-            for nodeset in nodesets:
-                if nodeset.name == vc.headnode:
-                    sanitized_obj['headnode_app_host'] = nodeset.app_host
-                    sanitized_obj['headnode_state'] = nodeset.state
-                    sanitized_obj['headnode_state_reason'] = nodeset.state_reason
-
-            return flask.jsonify(sanitized_obj)
-    return flask.jsonify(result), 404
+    result = _statuses('virtual_clusters', [name], _requested_fields())
+    if name in result:
+        return flask.jsonify(result[name])
+    return flask.jsonify({}), 404
+
+
+@app.route('/rest/virtual_clusters', methods=['GET'])
+@authenticated
+@advise_poll_interval('virtual_clusters')
+@conditional('request', 'nodeset')
+def virtual_clusters():
+    """
+    Get information for every cluster named in the ``names`` argument,
+    e.g. /rest/virtual_clusters?names=vc1,vc2&fields=state
+
+    :return: json object mapping each existing cluster name to its status
+    """
+    return flask.jsonify(_statuses('virtual_clusters', _requested_names(),
+                                   _requested_fields()))
 
 
 @app.route('/rest/allocation/<name>', methods=['GET'])
 @authenticated
+@advise_poll_interval('allocations')
+@conditional('allocation')
 def allocation(name):
     """
     Get information for a specified cluster and return
     it in as json or jsonp
 
+    Only the fields named in the ``fields`` argument are returned, if given.
+
     :return: json or jsonp status of cluster
     """
-    result = {}
-    vc3_client = get_vc3_client()
-    allocations = vc3_client.listAllocations()
-    for x in allocations:
-        if x.name == name:
-            sanitized_obj = {'name': x.name,
-                             'state': x.state,
-                             'action': x.action,
-                             'owner': x.owner,
-                             'displayname': x.displayname,
-                             'description': x.description,
-                             'statereason': x.state_reason,
-                             'pubtoken': x.pubtoken}
-            if x.pubtoken:
-                sanitized_obj['pubtoken'] = base64.b64decode(x.pubtoken).rstrip('\n')
-            return flask.jsonify(sanitized_obj)
-    return flask.jsonify(result), 404
+    result = _statuses('allocations', [name], _requested_fields())
+    if name in result:
+        return flask.jsonify(result[name])
+    return flask.jsonify({}), 404
+
+
+@app.route('/rest/allocations', methods=['GET'])
+@authenticated
+@advise_poll_interval('allocations')
+@conditional('allocation')
+def allocations():
+    """
+    Get information for every allocation named in the ``names`` argument,
+    e.g. /rest/allocations?names=alloc1,alloc2&fields=state
+
+    :return: json object mapping each existing allocation name to its
+             status
+    """
+    return flask.jsonify(_statuses('allocations', _requested_names(),
+                                   _requested_fields()))
+
+
+@app.route('/rest/events', methods=['GET'])
+@authenticated
+def status_events():
+    """
+    Stream status changes of the entities named in the ``names`` argument
+    as Server-Sent Events, e.g. /rest/events?kind=allocations&names=a,b
+
+    Each event is a ``status`` event whose data is a json object with the
+    entity ``name`` and its ``status``, as returned by the polling
+    endpoints.  The stream ends after VC3_EVENTS_MAX_AGE seconds and the
+    browser reconnects.  A stream holds a server worker for as long as it
+    is open, so events are only served when VC3_EVENTS is set.
+
+    :return: text/event-stream response, or 404 if events are unavailable
+    """
+    broker = get_status_broker()
+    kind = flask.request.args.get('kind')
+    if (not app.config.get('VC3_EVENTS') or broker is None or
+            kind not in STATUS_KINDS):
+        return flask.jsonify({}), 404
+    names = _requested_names()
+    deadline = time.time() + app.config.get('VC3_EVENTS_MAX_AGE', 300)
+
+    def stream():
+        yield 'retry: 4000\n\n'
+        # only once the body is being sent: the body of a HEAD request is
+        # never iterated, and a generator closed before it started doesn't
+        # run its finally clause
+        subscription = broker.subscribe(kind, names)
+        try:
+            while time.time() < deadline:
+                updates = subscription.pop()
+                if not updates:
+                    yield ': keepalive\n\n'
+                for name, status in updates:
+                    yield 'event: status\ndata: {0}\n\n'.format(
+                        flask.json.dumps({'name': name, 'status': status}))
+        finally:
+            broker.unsubscribe(subscription)
+
+    return flask.Response(flask.stream_with_context(stream()),
+                          mimetype='text/event-stream',
+                          headers={'Cache-Control': 'no-cache',
+                                   'X-Accel-Buffering': 'no'})
+
+
+@app.route('/rest/infoservice/stats', methods=['GET'])
+@authenticated
+def infoservice_stats():
+    """
+    Report usage statistics for the shared infoservice client
+
+    :return: json statistics of the client pool
+    """
+    stats = get_vc3_client().stats()
+    stats['fragment_cache'] = app.jinja_env.fragment_cache.stats()
+    broker = get_status_broker()
+    if broker is not None:
+        stats['events'] = broker.stats()
+    return flask.jsonify(stats)
@@ -0,0 +1,227 @@
+"""
+Full-text search of the blog pages.
+
+``SearchIndex`` keeps an inverted index of the words in every page's title,
+metadata and body, and ranks matches with BM25, so a query only reads the
+postings of its own words.  The index is updated incrementally: pages are
+keyed by path and a hash of their source, and only added or changed pages
+are tokenized again.  It is saved to disk after every update so the
+portal starts with a current index instead of tokenizing the whole blog.
+"""
+import collections
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+
+#: Words too common to be worth indexing
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that
+the this to was were will with
+""".split())
+#: Weight of a word by the part of the page it appears in
+FIELD_WEIGHTS = (('title', 3), ('meta', 2), ('body', 1))
+#: BM25 parameters
+K1 = 1.2
+B = 0.75
+#: Characters of the page text kept to show with results
+SUMMARY_LENGTH = 200
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_MARKUP = re.compile(r'<[^>]+>|[#*_`>\[\]()!|-]+')
+
+
+def tokenize(text):
+    """Lowercase words of a text, without stop words"""
+    return [word for word in _WORD.findall(text.lower())
+            if len(word) > 1 and word not in STOP_WORDS]
+
+
+def _meta_text(meta):
+    parts = []
+    for key, value in meta.items():
+        if key in ('title', 'date'):
+            continue
+        if isinstance(value, (list, tuple)):
+            parts.extend(u'%s' % v for v in value)
+        else:
+            parts.append(u'%s' % value)
+    return u' '.join(parts)
+
+
+def _document(page):
+    terms = collections.Counter()
+    meta = page.meta
+    fields = {'title': u'%s' % meta.get('title', ''),
+              'meta': _meta_text(meta),
+              'body': page.body}
+    for field, weight in FIELD_WEIGHTS:
+        for word in tokenize(fields[field]):
+            terms[word] += weight
+    summary = u' '.join(_MARKUP.sub(u' ', page.body).split())
+    return {'terms': dict(terms), 'length': sum(terms.values()),
+            'title': fields['title'],
+            'date': u'%s' % meta['date'] if 'date' in meta else None,
+            'summary': summary[:SUMMARY_LENGTH]}
+
+
+def page_hash(page):
+    """Hash of a page's source, its metadata and body"""
+    digest = hashlib.sha1(page._meta.encode('utf-8'))
+    digest.update(page.body.encode('utf-8'))
+    return digest.hexdigest()
+
+
+SearchResult = collections.namedtuple('SearchResult',
+                                      'path title date summary score')
+
+
+class SearchIndex(object):
+    """
+    Inverted index of FlatPages ranked with BM25
+
+    :param pages: FlatPages instance
+    :param path: file the index is saved to and loaded from, not saved if
+                 None
+    """
+
+    #: Version of the saved format, older files are ignored
+    FORMAT = 1
+
+    def __init__(self, pages, path=None, logger=None):
+        self.pages = pages
+        self.path = path
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._loaded = None
+        self._hashes = {}
+        self._documents = {}
+        self._postings = collections.defaultdict(dict)
+        self._total_length = 0
+        if path:
+            self._load()
+
+    def _add(self, path, digest, document):
+        self._hashes[path] = digest
+        self._documents[path] = document
+        self._total_length += document['length']
+        for term, frequency in document['terms'].items():
+            self._postings[term][path] = frequency
+
+    def _remove(self, path):
+        document = self._documents.pop(path)
+        del self._hashes[path]
+        self._total_length -= document['length']
+        for term in document['terms']:
+            postings = self._postings[term]
+            postings.pop(path, None)
+            if not postings:
+                del self._postings[term]
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (IOError, ValueError):
+            return
+        if saved.get('format') != self.FORMAT:
+            return
+        for path, (digest, document) in saved['documents'].items():
+            self._add(path, digest, document)
+
+    def _save(self):
+        saved = {'format': self.FORMAT,
+                 'documents': dict((path, (self._hashes[path], document))
+                                   for path, document in
+                                   self._documents.items())}
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(saved, f)
+        os.rename(tmp, self.path)
+
+    def update(self, pages=None):
+        """
+        Index added and changed pages and forget removed ones
+
+        :param pages: loaded pages, all of the FlatPages instance if None
+        :return: number of pages added, changed or removed
+        """
+        pages = list(pages if pages is not None else self.pages)
+        hashes = dict((page.path, page_hash(page)) for page in pages)
+        with self._lock:
+            removed = [path for path in self._hashes if path not in hashes]
+            for path in removed:
+                self._remove(path)
+            updated = 0
+            for page in pages:
+                digest = hashes[page.path]
+                if self._hashes.get(page.path) == digest:
+                    continue
+                if page.path in self._hashes:
+                    self._remove(page.path)
+                self._add(page.path, digest, _document(page))
+                updated += 1
+            if (updated or removed) and self.path:
+                try:
+                    self._save()
+                except (IOError, OSError) as e:
+                    if self.logger:
+                        self.logger.error("Saving the search index failed: "
+                                          "{0}".format(e))
+        return updated + len(removed)
+
+    def refresh(self, loaded):
+        """
+        Bring the index up to date with the pages FlatPages loaded
+
+        :param loaded: dict of path to page, as FlatPages keeps them
+        """
+        if self._loaded is not loaded:
+            self.update(loaded.values())
+            self._loaded = loaded
+
+    def search(self, query, limit=20):
+        """
+        Pages matching a query, best first
+
+        :param query: words to look for, pages matching more of them and
+                      more often rank higher
+        :return: list of SearchResult
+        """
+        # FlatPages keeps the loaded pages in a dict it replaces on reload
+        self.refresh(self.pages._pages)
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._documents)
+            if not terms or not count:
+                return []
+            average_length = float(self._total_length) / count or 1.0
+            scores = collections.defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) /
+                               (len(postings) + 0.5))
+                for path, frequency in postings.items():
+                    length = self._documents[path]['length']
+                    scores[path] += idf * frequency * (K1 + 1) / (
+                        frequency + K1 * (1 - B + B * length /
+                                          average_length))
+            best = heapq.nlargest(limit, scores.items(),
+                                  key=lambda item: item[1])
+            return [SearchResult(path, self._documents[path]['title'],
+                                 self._documents[path]['date'],
+                                 self._documents[path]['summary'], score)
+                    for path, score in best]
+
+    def stats(self):
+        with self._lock:
+            return {'pages': len(self._documents),
+                    'terms': len(self._postings), 'path': self.path}
@@ -0,0 +1,172 @@
+"""
+Declarative serializers for REST responses.
+
+The status endpoints used to build their sanitized dicts by hand on every
+poll, always with every field, and decoded allocation public keys every
+time.  A ``Serializer`` declares its fields once; serialized entities and
+their ``?fields=`` projections are cached per entity version, so polling an
+unchanged entity doesn't build or decode anything.
+"""
+import base64
+import collections
+import threading
+
+#: Returned by a field getter to leave the field out
+OMIT = object()
+
+
+class Field(object):
+    """
+    One field of a serialized entity
+
+    :param getter: callable taking the source object and returning the
+                   value, or OMIT to leave the field out
+    :param source: name of the object the value is read from, 'entity' or
+                   a related object passed to Serializer.serialize()
+    """
+
+    def __init__(self, getter, source='entity'):
+        self.getter = getter
+        self.source = source
+
+    def value(self, sources):
+        obj = sources.get(self.source)
+        if obj is None:
+            return OMIT
+        return self.getter(obj)
+
+
+def attribute(attr, source='entity'):
+    """Field holding an attribute of the entity or of a related object"""
+    return Field(lambda obj: getattr(obj, attr), source)
+
+
+class Serializer(object):
+    """
+    Turn entities into dicts of declared fields
+
+    :param fields: sequence of (name, Field) tuples
+    :param max_entries: number of serialized entities and projections to
+                        keep
+    """
+
+    def __init__(self, fields, max_entries=1024):
+        self.fields = collections.OrderedDict(fields)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+
+    def _lookup(self, key):
+        with self._lock:
+            result = self._cache.pop(key, None)
+            if result is not None:
+                self._cache[key] = result
+            return result
+
+    def _store(self, key, result):
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _build(self, entity, related):
+        sources = dict(related, entity=entity)
+        result = {}
+        for name, field in self.fields.items():
+            value = field.value(sources)
+            if value is not OMIT:
+                result[name] = value
+        return result
+
+    def serialize(self, entity, version=None, fields=None, **related):
+        """
+        Serialize an entity
+
+        :param entity: infoservice entity
+        :param version: hashable version of the entity and of every related
+                        object, results are only cached when given
+        :param fields: names of the fields to include, all fields if None;
+                       unknown names are ignored
+        :param related: related objects read by fields with another source
+        :return: dict of field name to value
+        """
+        fields = tuple(sorted(set(fields))) if fields else None
+        if version is None:
+            result = self._build(entity, related)
+            if fields:
+                result = dict((f, result[f]) for f in fields if f in result)
+            return result
+
+        result = self._lookup((entity.name, version, fields))
+        if result is None:
+            full = self._lookup((entity.name, version, None))
+            if full is None:
+                full = self._build(entity, related)
+                self._store((entity.name, version, None), full)
+            result = full
+            if fields:
+                result = dict((f, full[f]) for f in fields if f in full)
+                self._store((entity.name, version, fields), result)
+        return dict(result)
+
+    def cached(self, name, version, fields=None):
+        """
+        Look up an entity serialized earlier, without fetching the entity
+
+        :return: dict of field name to value, or None if not cached
+        """
+        fields = tuple(sorted(set(fields))) if fields else None
+        result = self._lookup((name, version, fields))
+        if result is None:
+            return None
+        return dict(result)
+
+
+def _statusinfo(counter):
+    def getter(vc):
+        if vc.statusinfo is None:
+            return OMIT
+        return vc.statusinfo[vc.cluster][counter]
+    return Field(getter)
+
+
+def _decoded_pubtoken(allocation):
+    if not allocation.pubtoken:
+        return allocation.pubtoken
+    return base64.b64decode(allocation.pubtoken).rstrip('\n')
+
+
+#: Status of a virtual cluster, with its headnode nodeset as ``headnode``
+VIRTUAL_CLUSTER = Serializer([
+    ('name', attribute('name')),
+    ('state', attribute('state')),
+    ('cluster', attribute('cluster')),
+    ('statusraw', attribute('statusraw')),
+    ('statusinfo', attribute('statusinfo')),
+    ('displayname', attribute('displayname')),
+    ('description', attribute('description')),
+    ('statereason', attribute('state_reason')),
+    ('action', attribute('action')),
+    ('headnode', attribute('headnode')),
+    ('statusinfo_error', _statusinfo('error')),
+    ('statusinfo_idle', _statusinfo('idle')),
+    ('statusinfo_node_number', _statusinfo('node_number')),
+    ('statusinfo_requested', _statusinfo('requested')),
+    ('statusinfo_running', _statusinfo('running')),
+    ('headnode_app_host', attribute('app_host', source='headnode')),
+    ('headnode_state', attribute('state', source='headnode')),
+    ('headnode_state_reason', attribute('state_reason',
+                                        source='headnode')),
+])
+
+#: Status of an allocation, with its public key decoded
+ALLOCATION = Serializer([
+    ('name', attribute('name')),
+    ('state', attribute('state')),
+    ('action', attribute('action')),
+    ('owner', attribute('owner')),
+    ('displayname', attribute('displayname')),
+    ('description', attribute('description')),
+    ('statereason', attribute('state_reason')),
+    ('pubtoken', Field(_decoded_pubtoken)),
+])
@@ -0,0 +1,123 @@
+"""
+Coalescing of identical concurrent infoservice calls.
+
+When many users load the same page at once, e.g. right after the entity
+cache expired or at startup, every worker thread used to issue the same
+``list*``/``get*`` call in parallel.  ``SingleFlight`` lets the first
+caller make the backend call while identical concurrent callers wait for
+it and share its result.
+"""
+import collections
+import copy
+import threading
+
+
+class _Call(object):
+    """A backend call in flight and the callers waiting for it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Share one in-flight call between concurrent callers with the same key
+
+    Waiting callers get a deep copy of the result, so callers mutating
+    entities they were handed don't affect each other.  If the call raises,
+    every caller waiting for it gets the same exception.
+
+    :param max_keys: number of keys to keep metrics for
+    """
+
+    def __init__(self, max_keys=256):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._metrics = collections.OrderedDict()
+        self.calls = 0
+        self.shared = 0
+
+    def _record(self, name, shared):
+        metrics = self._metrics.pop(name, None) or {'calls': 0, 'shared': 0,
+                                                    'max_waiters': 0}
+        if shared:
+            metrics['shared'] += 1
+        else:
+            metrics['calls'] += 1
+        self._metrics[name] = metrics
+        while len(self._metrics) > self.max_keys:
+            self._metrics.popitem(last=False)
+        return metrics
+
+    def do(self, key, fn, label=None):
+        """
+        Call ``fn()``, unless an identical call is already in flight
+
+        :param key: hashable key identifying the call
+        :param fn: callable taking no arguments
+        :param label: name to report metrics under, defaults to repr(key)
+        :return: result of fn(), or a copy of the in-flight call's result
+        """
+        label = label or repr(key)
+        leader = False
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                metrics = self._record(label, True)
+                metrics['max_waiters'] = max(metrics['max_waiters'],
+                                             call.waiters)
+            else:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                self._record(label, False)
+                leader = True
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        result = None
+        try:
+            result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            if waiters and call.error is None:
+                # copy before our caller gets a chance to modify the result
+                call.result = copy.deepcopy(result)
+            call.done.set()
+
+    def stats(self):
+        """
+        Report coalescing metrics
+
+        :return: dict of backend calls made, calls shared and per-key
+                 counters for the most recently used keys
+        """
+        with self._lock:
+            return {'calls': self.calls,
+                    'shared': self.shared,
+                    'in_flight': len(self._calls),
+                    'keys': dict((name, dict(metrics)) for name, metrics
+                                 in self._metrics.items())}
+
+
+def call_label(name, args, kwargs):
+    """Readable name of a call, e.g. getRequest(requestname='vc1')"""
+    arguments = [repr(a) for a in args]
+    arguments.extend('{0}={1!r}'.format(k, v)
+                     for k, v in sorted(kwargs.items()))
+    return '{0}({1})'.format(name, ', '.join(arguments))
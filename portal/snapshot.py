@@ -0,0 +1,221 @@
+"""
+Background snapshot of the infoservice state.
+
+A refresher thread periodically fetches every entity type and atomically
+swaps in a new, versioned ``Snapshot``.  The shared client serves reads from
+the current snapshot, so pages and ``/rest/*`` endpoints don't wait on the
+infoservice; only writes go to it directly.  While a refresh is in flight or
+failing the last good snapshot keeps being served, marked stale.
+
+Each refresh is diffed against the previous one; entity types without
+changes keep their entity lists and version, and the change set is
+published to subscribers of ``SnapshotRefresher.sync``.
+"""
+import atexit
+import copy
+import threading
+import time
+
+from portal.catalog import GET_METHODS, LIST_METHODS
+from portal.sync import IncrementalSync
+
+
+class Snapshot(object):
+    """Immutable copy of every infoservice entity at one point in time"""
+
+    def __init__(self, version, entities, taken_at, type_versions=None):
+        self.version = version
+        self.taken_at = taken_at
+        self._entities = entities
+        self._type_versions = type_versions or {}
+        self._by_name = dict(
+            (entity_type, dict((e.name, e) for e in items))
+            for entity_type, items in entities.items())
+
+    def __contains__(self, entity_type):
+        return entity_type in self._entities
+
+    def type_version(self, entity_type):
+        """
+        Snapshot version in which entities of a type last changed
+        """
+        return self._type_versions.get(entity_type, self.version)
+
+    def list(self, entity_type):
+        """Copy of every entity of a type"""
+        return copy.deepcopy(self._entities[entity_type])
+
+    def get(self, entity_type, name):
+        """Copy of a single entity, or None if it isn't in the snapshot"""
+        entity = self._by_name[entity_type].get(name)
+        if entity is None:
+            return None
+        return copy.deepcopy(entity)
+
+    def names(self, entity_type):
+        return list(self._by_name.get(entity_type, ()))
+
+
+class SnapshotRefresher(object):
+    """
+    Keep a current Snapshot of the infoservice in a background thread
+
+    Entity types the portal writes to are marked dirty and not served from
+    the snapshot until a refresh started after the write completes, so users
+    always see their own changes.
+    """
+
+    def __init__(self, pool, interval=15, max_age=None, logger=None):
+        self.pool = pool
+        self.interval = interval
+        self.max_age = max_age or 4 * interval
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = None
+        self._refreshing = False
+        self._failures = 0
+        self._last_error = None
+        self._write_seq = 0
+        self._dirty = {}
+        self.sync = IncrementalSync(logger=logger)
+
+    def start(self):
+        """Take a first snapshot and keep refreshing it in the background"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name='vc3-snapshot-refresher')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def _fetch(self):
+        entities = {}
+        with self.pool.connection() as client_api:
+            for entity_type, method in LIST_METHODS.items():
+                entities[entity_type] = getattr(client_api, method)()
+
+            # nodeinfo can't be listed, fetch the ones resources refer to
+            method, argument = GET_METHODS['nodeinfo']
+            nodeinfos = []
+            for name in set(r.nodeinfo for r in entities['resource']
+                            if r.nodeinfo):
+                nodeinfo = getattr(client_api, method)(**{argument: name})
+                if nodeinfo is not None:
+                    nodeinfos.append(nodeinfo)
+            entities['nodeinfo'] = nodeinfos
+        return entities
+
+    def refresh(self):
+        """
+        Fetch a new snapshot and swap it in
+
+        On failure the previous snapshot is kept and marked stale.
+
+        :return: the current Snapshot, or None if none could be taken yet
+        """
+        with self._lock:
+            self._refreshing = True
+            started_seq = self._write_seq
+        try:
+            entities = self._fetch()
+        except Exception as e:
+            with self._lock:
+                self._refreshing = False
+                self._failures += 1
+                self._last_error = str(e)
+            if self.logger:
+                self.logger.error("Infoservice snapshot refresh failed: "
+                                  "{0}".format(e))
+            return self._snapshot
+
+        changes = self.sync.diff(entities)
+        with self._lock:
+            previous = self._snapshot
+            version = previous.version + 1 if previous else 1
+            type_versions = {}
+            for entity_type in entities:
+                if (previous is not None and entity_type in previous and
+                        not changes.touched(entity_type)):
+                    # keep the unchanged list so derived indexes stay valid
+                    entities[entity_type] = previous._entities[entity_type]
+                    type_versions[entity_type] = previous.type_version(
+                        entity_type)
+                else:
+                    type_versions[entity_type] = version
+            snapshot = self._snapshot = Snapshot(version, entities,
+                                                 time.time(), type_versions)
+            self._refreshing = False
+            self._failures = 0
+            self._last_error = None
+            for entity_type, seq in list(self._dirty.items()):
+                if seq <= started_seq:
+                    del self._dirty[entity_type]
+
+        self.sync.publish(changes, snapshot)
+        return snapshot
+
+    def mark_dirty(self, entity_types=None):
+        """
+        Stop serving entity types the portal has just written to
+
+        :param entity_types: iterable of entity types, all types if None
+        """
+        with self._lock:
+            self._write_seq += 1
+            if entity_types is None:
+                entity_types = list(LIST_METHODS) + ['nodeinfo']
+            for entity_type in entity_types:
+                self._dirty[entity_type] = self._write_seq
+
+    def snapshot_for(self, entity_type):
+        """
+        Snapshot able to serve an entity type
+
+        :return: Snapshot, or None if the type must be read from the
+                 infoservice
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            if (snapshot is None or entity_type in self._dirty or
+                    entity_type not in snapshot):
+                return None
+            return snapshot
+
+    @property
+    def stale(self):
+        """
+        Whether the current snapshot may be out of date
+
+        True while a refresh is in flight, after a failed refresh or when the
+        snapshot is older than ``max_age`` seconds.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            return (snapshot is None or self._refreshing or
+                    self._failures > 0 or
+                    time.time() - snapshot.taken_at > self.max_age)
+
+    def status(self):
+        snapshot = self._snapshot
+        status = {'version': snapshot.version if snapshot else None,
+                  'taken_at': snapshot.taken_at if snapshot else None,
+                  'stale': self.stale}
+        with self._lock:
+            status.update({'refreshing': self._refreshing,
+                           'failures': self._failures,
+                           'last_error': self._last_error,
+                           'dirty': sorted(self._dirty),
+                           'sync_seq': self.sync.seq})
+        return status
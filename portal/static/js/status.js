@@ -0,0 +1,74 @@
+// Keep the status of virtual clusters or allocations up to date.
+//
+// Status changes are pushed by the server over Server-Sent Events when the
+// page sets status_events, the server has them on; otherwise, or when the
+// browser doesn't support them, the status is polled instead.
+// Polls follow the interval the server recommends in the X-Poll-Interval
+// header, backing off exponentially while nothing changes.
+// callback(name, status) is called for every status that changed.
+function watch_states(kind, names, callback){
+  if(names.length == 0){
+    return;
+  }
+  var query = {names: names.join(",")};
+  var polling = false;
+  var advised = 4;
+  var backoff = 1;
+  var last = null;
+
+  function schedule(){
+    if(polling){
+      setTimeout(poll, Math.min(advised * backoff, 600) * 1000);
+    }
+  }
+
+  function poll(){
+    jQuery.ajax({
+      url: "/rest/" + kind,
+      type: "get",
+      data: query,
+      dataType: 'json',
+      success: function(statuses, text_status, xhr){
+        var body = JSON.stringify(statuses);
+        if(body == last){
+          backoff = Math.min(backoff * 2, 8);
+        } else {
+          backoff = 1;
+          last = body;
+          jQuery.each(statuses, callback);
+        }
+        advised = parseInt(xhr.getResponseHeader("X-Poll-Interval"), 10) || advised;
+        schedule();
+      },
+      error: function(xhr){
+        backoff = Math.min(backoff * 2, 8);
+        schedule();
+      }
+    });
+  }
+
+  function start_polling(){
+    if(!polling){
+      polling = true;
+      schedule();
+    }
+  }
+
+  poll();
+  if(!window.status_events || !window.EventSource){
+    start_polling();
+    return;
+  }
+  var source = new EventSource("/rest/events?" + jQuery.param(
+    jQuery.extend({kind: kind}, query)));
+  source.addEventListener("status", function(e){
+    var data = JSON.parse(e.data);
+    callback(data.name, data.status);
+  });
+  source.onerror = function(){
+    // the browser reconnects by itself unless the server refused the stream
+    if(source.readyState == EventSource.CLOSED){
+      start_polling();
+    }
+  };
+}
@@ -0,0 +1,89 @@
+"""
+Poll intervals recommended to clients watching virtual cluster and
+allocation status.
+
+Statuses themselves are built by the serializers in ``portal.serializers``.
+"""
+import collections
+import threading
+import time
+
+#: Recommended seconds between polls while an entity is changing state,
+#: while it is in a stable state and once it has reached a final state
+POLL_INTERVAL_TRANSITIONAL = 4
+POLL_INTERVAL_STABLE = 30
+POLL_INTERVAL_FINAL = 300
+#: Entities that changed this many seconds ago or less are polled as if
+#: they were changing state
+RECENT_CHANGE = 60
+
+STABLE_STATES = ('running', 'ready')
+FINAL_STATES = ('terminated', 'failure', 'validation_failure')
+
+
+def poll_interval(status, changed_at=None, now=None):
+    """
+    Seconds a client should wait before polling a status again
+
+    :param status: virtual cluster or allocation status
+    :param changed_at: time the entity was last seen to change, if known
+    :return: recommended poll interval in seconds
+    """
+    return recent_interval(state_interval(status), changed_at, now)
+
+
+def recent_interval(interval, changed_at=None, now=None):
+    """
+    Poll interval of an entity given the one of its state and how recently
+    it changed
+    """
+    now = now or time.time()
+    if changed_at is not None and now - changed_at <= RECENT_CHANGE:
+        return POLL_INTERVAL_TRANSITIONAL
+    return interval
+
+
+def state_interval(status):
+    """Poll interval recommended by a status alone, in seconds"""
+    state = status.get('state')
+    action = status.get('action')
+    if action in ('validate', 'relaunch') or (
+            action == 'terminate' and state not in FINAL_STATES):
+        return POLL_INTERVAL_TRANSITIONAL
+    if state in FINAL_STATES:
+        return POLL_INTERVAL_FINAL
+    if state in STABLE_STATES:
+        return POLL_INTERVAL_STABLE
+    return POLL_INTERVAL_TRANSITIONAL
+
+
+class StateIntervals(object):
+    """
+    State poll intervals of the entities of recent responses, by ETag
+
+    A 304 response stands for the same statuses as the response it
+    revalidates, so its poll interval can be worked out from these and
+    from how recently the entities changed, without building the statuses
+    again.
+
+    :param max_entries: number of responses kept
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._intervals = collections.OrderedDict()
+
+    def get(self, etag):
+        """Dict of entity name to state interval, or None if unknown"""
+        with self._lock:
+            intervals = self._intervals.pop(etag, None)
+            if intervals is not None:
+                self._intervals[etag] = intervals
+            return intervals
+
+    def put(self, etag, intervals):
+        with self._lock:
+            self._intervals[etag] = intervals
+            while len(self._intervals) > self.max_entries:
+                self._intervals.popitem(last=False)
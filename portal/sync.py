@@ -0,0 +1,161 @@
+"""
+Incremental synchronisation of infoservice entities.
+
+The infoservice can't report which entities changed since a given time, so
+each sync still fetches full entity lists, but only entities whose content
+hash differs from the previous sync are reported.  The resulting per-type
+``ChangeSet`` is applied in place by the snapshot and the entity cache, and
+published to any other subscriber, e.g. status streams or fragment caches.
+"""
+import collections
+import hashlib
+import json
+import threading
+import time
+
+
+def fingerprint(entity):
+    """
+    Content hash of an entity
+
+    :param entity: infoservice entity
+    :return: hex digest of the entity's attributes
+    """
+    content = json.dumps(vars(entity), sort_keys=True, default=repr)
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+class ChangeSet(object):
+    """Entities added, changed and removed in one sync, per entity type"""
+
+    def __init__(self, seq, changes):
+        self.seq = seq
+        self.changes = changes
+
+    def __nonzero__(self):
+        return bool(self.changes)
+    __bool__ = __nonzero__
+
+    def entity_types(self):
+        return list(self.changes)
+
+    def touched(self, entity_type):
+        """Whether any entity of a type was added, changed or removed"""
+        return entity_type in self.changes
+
+    def names(self, entity_type):
+        """Names of every added, changed or removed entity of a type"""
+        change = self.changes.get(entity_type)
+        if change is None:
+            return set()
+        return set(change['added'] + change['changed'] + change['removed'])
+
+    def as_dict(self):
+        return {'seq': self.seq, 'changes': self.changes}
+
+
+class IncrementalSync(object):
+    """
+    Diff successive full entity lists and publish the changes
+
+    Subscribers are called with every non-empty ChangeSet and the Snapshot
+    it was computed for.  The last ``history`` change sets are kept so that
+    consumers can catch up with ``changes_since()``.
+    """
+
+    def __init__(self, history=100, logger=None):
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        self._changed_at = {}
+        self._seq = 0
+        self._history = collections.deque(maxlen=history)
+        self._subscribers = []
+
+    def diff(self, entities):
+        """
+        Compute the changes since the previous call
+
+        :param entities: dict of entity type to list of entities
+        :return: ChangeSet
+        """
+        changes = {}
+        fingerprints = {}
+        now = time.time()
+        with self._lock:
+            for entity_type, items in entities.items():
+                old = self._fingerprints.get(entity_type, {})
+                new = dict((e.name, fingerprint(e)) for e in items)
+                fingerprints[entity_type] = new
+                change = {'added': sorted(n for n in new if n not in old),
+                          'changed': sorted(n for n in new
+                                            if n in old and old[n] != new[n]),
+                          'removed': sorted(n for n in old if n not in new)}
+                if change['added'] or change['changed'] or change['removed']:
+                    changes[entity_type] = change
+                if entity_type in self._fingerprints:
+                    # the first sync of a type says nothing about recency
+                    for name in change['added'] + change['changed']:
+                        self._changed_at[(entity_type, name)] = now
+                for name in change['removed']:
+                    self._changed_at.pop((entity_type, name), None)
+            self._fingerprints.update(fingerprints)
+            if changes:
+                self._seq += 1
+            changeset = ChangeSet(self._seq, changes)
+            if changes:
+                self._history.append(changeset)
+        return changeset
+
+    def subscribe(self, callback):
+        """
+        Call ``callback(changeset, snapshot)`` after every sync that found
+        changes
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def publish(self, changeset, snapshot):
+        if not changeset:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(changeset, snapshot)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error("Change set subscriber {0} failed: "
+                                      "{1}".format(callback, e))
+
+    def changes_since(self, seq):
+        """
+        Change sets published after sequence number ``seq``
+
+        :return: list of ChangeSets, or None if some of them are no longer
+                 kept and the consumer has to start over
+        """
+        with self._lock:
+            history = list(self._history)
+            current = self._seq
+        if seq >= current:
+            return []
+        if not history or history[0].seq > seq + 1:
+            return None
+        return [c for c in history if c.seq > seq]
+
+    def changed_at(self, entity_type, name):
+        """
+        Time an entity was last seen to change
+
+        :return: timestamp, or None if it hasn't changed since the first sync
+        """
+        with self._lock:
+            return self._changed_at.get((entity_type, name))
+
+    @property
+    def seq(self):
+        with self._lock:
+            return self._seq
@@ -0,0 +1,148 @@
+"""
+Template loading for production.
+
+With ``TEMPLATES_AUTO_RELOAD`` on, Jinja checks the template files on every
+render, and each worker compiled every template the first time a request
+used it.  When auto-reload is off, as it is by default outside debug mode,
+compiled templates are kept in a ``FileSystemBytecodeCache`` shared by
+workers and restarts, and every template is compiled when a process starts
+serving, see ``portal.start``, so no request waits on it.
+
+The ``benchmark-templates`` command times startup and the first requests in
+fresh processes, with auto-reload, and in production mode with a cold and
+a warm bytecode cache.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+#: Run in a fresh interpreter by the benchmark; prints the seconds the
+#: import of the portal and its first requests took
+_BENCHMARK_SCRIPT = """
+import json, sys, time
+started = time.time()
+from portal import app, start
+start()
+imported = time.time()
+client = app.test_client()
+statuses = [client.get(url).status_code for url in sys.argv[1:]]
+done = time.time()
+print(json.dumps({'startup': imported - started, 'requests': done - imported,
+                  'statuses': statuses}))
+"""
+
+
+def precompile(app):
+    """
+    Compile every template into the environment's cache
+
+    :return: names of the templates compiled
+    """
+    env = app.jinja_env
+    compiled = []
+    for name in env.list_templates(extensions=['html']):
+        try:
+            env.get_template(name)
+        except TemplateSyntaxError as e:
+            app.logger.error("Template {0} does not compile: "
+                             "{1}".format(name, e))
+            continue
+        compiled.append(name)
+    return compiled
+
+
+def warm_up(app):
+    """Compile every template, unless they are reloaded when they change"""
+    if app.jinja_env.auto_reload:
+        return
+    started = time.time()
+    compiled = precompile(app)
+    app.logger.debug("Precompiled {0} templates in {1:.2f}s".format(
+        len(compiled), time.time() - started))
+
+
+def _benchmark_run(root, settings, urls):
+    with tempfile.NamedTemporaryFile('w', suffix='.conf',
+                                     delete=False) as f:
+        for key, value in settings.items():
+            f.write('%s = %r\n' % (key, value))
+    env = dict(os.environ, VC3_PORTAL_SETTINGS=f.name)
+    try:
+        output = subprocess.check_output(
+            [sys.executable, '-c', _BENCHMARK_SCRIPT] + list(urls),
+            cwd=root, env=env)
+    finally:
+        os.remove(f.name)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def benchmark(root, urls, runs=3):
+    """
+    Time startup and first requests in each template mode
+
+    :param root: directory the portal package is imported from
+    :param urls: URLs requested after startup
+    :return: list of (mode, best startup seconds, best request seconds)
+    """
+    cache_dir = tempfile.mkdtemp(prefix='vc3-jinja-benchmark-')
+    quiet = {'VC3_SNAPSHOT_INTERVAL': 0, 'VC3_PAGES_RELOAD_INTERVAL': 0}
+    modes = [
+        ('auto-reload', dict(quiet, TEMPLATES_AUTO_RELOAD=True), False),
+        ('production, cold cache',
+         dict(quiet, TEMPLATES_AUTO_RELOAD=False,
+              VC3_TEMPLATE_CACHE_DIR=cache_dir), True),
+        ('production, warm cache',
+         dict(quiet, TEMPLATES_AUTO_RELOAD=False,
+              VC3_TEMPLATE_CACHE_DIR=cache_dir), False),
+    ]
+    results = []
+    try:
+        for mode, settings, clear in modes:
+            timings = []
+            for _ in range(runs):
+                if clear:
+                    for filename in os.listdir(cache_dir):
+                        os.remove(os.path.join(cache_dir, filename))
+                timings.append(_benchmark_run(root, settings, urls))
+            results.append((mode, min(t['startup'] for t in timings),
+                            min(t['requests'] for t in timings)))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def init_app(app):
+    """Cache compiled templates unless they are reloaded"""
+    auto_reload = app.config.get('TEMPLATES_AUTO_RELOAD')
+    if auto_reload is None:
+        auto_reload = app.debug
+    app.jinja_env.auto_reload = auto_reload
+    if not auto_reload:
+        directory = app.config.get(
+            'VC3_TEMPLATE_CACHE_DIR',
+            os.path.join(app.instance_path, 'jinja_cache'))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    @app.cli.command('benchmark-templates')
+    @click.option('--url', 'urls', multiple=True,
+                  help='URL to request after startup, may be repeated.')
+    @click.option('--runs', default=3,
+                  help='Runs of each mode, the best one is reported.')
+    def benchmark_templates_command(urls, runs):
+        """Time startup and first requests in each template mode."""
+        urls = urls or ('/', '/blog', '/team', '/community')
+        root = os.path.dirname(app.root_path)
+        click.echo('{0:<24} {1:>10} {2:>16}'.format(
+            'mode', 'startup', 'first requests'))
+        for mode, startup, requests in benchmark(root, urls, runs):
+            click.echo('{0:<24} {1:>9.3f}s {2:>15.3f}s'.format(
+                mode, startup, requests))
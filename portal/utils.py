@@ -1,20 +1,17 @@
 from flask import redirect, request, session, url_for, flash
 from threading import Lock
-from ConfigParser import SafeConfigParser
 
 import os
 import errno
 
 import globus_sdk
 
-from vc3client import client
-
 try:
     from urllib.parse import urlparse, urljoin
 except ImportError:
     from urlparse import urlparse, urljoin
 
-from portal import app
+from portal import app, get_vc3_client, get_vc3_catalog, vc3_fanout
 
 
 def load_portal_client():
@@ -78,21 +75,15 @@ def get_portal_tokens(
         return get_portal_tokens.access_tokens
 
 
-def get_vc3_client():
+def fetch_all(*calls, **kwargs):
     """
-    Return a VC3 client instance
+    Run independent infoservice reads concurrently
 
-    :return: VC3 client instance on success
+    :param calls: callables taking no arguments, e.g. vc3_client.listUsers
+    :param timeout: seconds to wait for each call
+    :return: list of results, in the order of calls
     """
-    c = SafeConfigParser()
-    c.readfp(open(app.config['VC3_CLIENT_CONFIG']))
-
-    try:
-        client_api = client.VC3ClientAPI(c)
-        return client_api
-    except Exception as e:
-        app.logger.error("Couldn't get vc3 client: {0}".format(e))
-        raise
+    return vc3_fanout.run(*calls, **kwargs)
 
 
 get_portal_tokens.lock = Lock()
@@ -126,13 +117,8 @@ def project_in_vc(name):
     :return: True if user exists in project or False otherwise
     """
     vc3_client = get_vc3_client()
-    projects = vc3_client.listProjects()
     vc = vc3_client.getRequest(requestname=name)
-    vc_owner_projects = []
-
-    for project in projects:
-        if vc.owner == project.owner:
-            vc_owner_projects.append(project)
+    vc_owner_projects = get_vc3_catalog().filter('project', 'owner', vc.owner)
 
     for p in vc_owner_projects:
         if (session['name'] in p.members or session['name'] == p.owner):
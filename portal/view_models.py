@@ -0,0 +1,76 @@
+"""
+Entities joined with their related entities for rendering.
+
+Templates used to call the infoservice for every table row, e.g. to look up
+the cluster template of each virtual cluster or the nodeinfo of each
+resource.  Views now resolve those relations up front, with one bulk fetch
+per entity type, and hand the templates ``ViewModel`` rows instead.
+"""
+
+
+class ViewModel(object):
+    """
+    An entity together with related entities
+
+    Attributes not set on the view model are read from the wrapped entity,
+    so templates can use a view model wherever they used the entity.
+    Setting an attribute only changes the view model, never the entity.
+    """
+
+    def __init__(self, entity, **related):
+        self.entity = entity
+        self.__dict__.update(related)
+
+    def __getattr__(self, name):
+        if name == 'entity':
+            raise AttributeError(name)
+        return getattr(self.entity, name)
+
+
+def requests_with_clusters(vc3_client, vc3_requests):
+    """
+    Join virtual clusters with their cluster templates
+
+    :param vc3_client: VC3 client
+    :param vc3_requests: list of virtual clusters
+    :return: list of ViewModels with a ``clusterinfo`` attribute
+    """
+    clusters = vc3_client.get_many('cluster',
+                                   [r.cluster for r in vc3_requests])
+    return [ViewModel(r, clusterinfo=clusters.get(r.cluster))
+            for r in vc3_requests]
+
+
+def resources_with_nodeinfo(vc3_client, resources, public_only=False):
+    """
+    Join resources with their node information
+
+    Only public resources show their node information, the others get a
+    ``nodeinfo_detail`` of None.
+
+    :param vc3_client: VC3 client
+    :param resources: list of resources
+    :param public_only: only keep public resources
+    :return: list of ViewModels with a ``nodeinfo_detail`` attribute
+    """
+    if public_only:
+        resources = [r for r in resources if r.public]
+    nodeinfos = vc3_client.get_many('nodeinfo',
+                                    [r.nodeinfo for r in resources
+                                     if r.public])
+    return [ViewModel(r, nodeinfo_detail=nodeinfos.get(r.nodeinfo))
+            for r in resources]
+
+
+def requests_with_headnodes(vc3_client, vc3_requests):
+    """
+    Join virtual clusters with their headnode nodesets
+
+    :param vc3_client: VC3 client
+    :param vc3_requests: list of virtual clusters
+    :return: list of ViewModels with ``headnode`` replaced by the nodeset
+    """
+    headnodes = vc3_client.get_many(
+        'nodeset', [r.headnode for r in vc3_requests if r.headnode])
+    return [ViewModel(r, headnode=headnodes.get(r.headnode))
+            for r in vc3_requests]
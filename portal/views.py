@@ -1,4 +1,5 @@
 import base64
+import functools
 import traceback
 import sys
 import time
@@ -9,14 +10,20 @@ from datetime import datetime, timedelta, tzinfo
 import pytz
 import tzlocal
 
-from flask import (flash, redirect, render_template, request,
+from flask import (abort, flash, redirect, render_template, request,
                    session, url_for)
 
 
-from portal import app, pages
-from portal.decorators import authenticated, allocation_validated, project_exists
+from portal import app, pages, blog_index, search_index
+from portal.decorators import (authenticated, allocation_validated,
+                               conditional, project_exists)
 from portal.utils import (load_portal_client, get_safe_redirect,
-                          get_vc3_client, project_validated, project_in_vc)
+                          get_vc3_client, get_vc3_catalog, fetch_all,
+                          project_validated, project_in_vc)
+from portal.lazy import lazy_list
+from portal.view_models import (requests_with_clusters,
+                                requests_with_headnodes,
+                                resources_with_nodeinfo)
 
 from vc3infoservice.core import InfoEntityExistsException
 
@@ -89,26 +96,63 @@ def status():
 # -----------------------------------------
 
 
+def _blog_page(pagination):
+    """Page of articles that was requested, 404 if it is out of range"""
+    if not pagination.exists:
+        abort(404)
+    return pagination
+
+
+def _page_number():
+    return request.args.get('page', 1, type=int)
+
+
+def _per_page():
+    return app.config.get('VC3_BLOG_PAGE_SIZE', 10)
+
+
 @app.route('/blog', methods=['GET'])
 def blog():
     """Articles are pages with a publication date"""
-    articles = (p for p in pages if 'date' in p.meta)
-    """Show the 10 most recent articles, most recent first"""
-    latest = sorted(articles, reverse=True, key=lambda p: p.meta['date'])
-    blog_pages = latest[:10]
+    """Show a page of the most recent articles, most recent first"""
+    pagination = _blog_page(blog_index.latest(_page_number(), _per_page()))
     taglist = []
-    for p in blog_pages:
-        if p.meta['tags'][0] not in taglist:
-            taglist.append(p.meta['tags'][0])
+    for p in pagination.items:
+        tags = p.meta.get('tags') or []
+        if tags and tags[0] not in taglist:
+            taglist.append(tags[0])
     """Send the user to the blog page"""
-    return render_template('blog.html', pages=blog_pages, taglist=taglist)
+    return render_template('blog.html', pages=pagination.items,
+                           pagination=pagination, taglist=taglist,
+                           months=blog_index.months())
 
 
 @app.route('/blog/tag/<string:tag>/', methods=['GET'])
 def tag(tag):
     """Automatic routing and compiling for article tags"""
-    tagged = [p for p in pages if tag in p.meta.get('tags', [])]
-    return render_template('blog_tag.html', pages=tagged, tag=tag)
+    pagination = _blog_page(blog_index.tagged(tag, _page_number(),
+                                              _per_page()))
+    return render_template('blog_tag.html', pages=pagination.items,
+                           pagination=pagination, tag=tag)
+
+
+@app.route('/blog/archive/<int:year>/<int:month>/', methods=['GET'])
+def archive(year, month):
+    """Articles published in a month"""
+    pagination = _blog_page(blog_index.archive(year, month, _page_number(),
+                                               _per_page()))
+    if not pagination.total:
+        abort(404)
+    return render_template('blog_archive.html', pages=pagination.items,
+                           pagination=pagination, year=year, month=month)
+
+
+@app.route('/blog/search', methods=['GET'])
+def search():
+    """Blog pages matching the words of the q parameter, best first"""
+    query = request.args.get('q', '').strip()
+    results = search_index.search(query) if query else []
+    return render_template('blog_search.html', query=query, results=results)
 
 
 @app.route('/blog/<path:path>/', methods=['GET'])
@@ -122,7 +166,9 @@ def page(path):
 def list_home_resources():
     """ Route for HPC and Resources List View """
     vc3_client = get_vc3_client()
-    resources = vc3_client.listResources()
+    resources = resources_with_nodeinfo(vc3_client,
+                                        vc3_client.listResources(),
+                                        public_only=True)
 
     return render_template('home_resource.html', resources=resources)
 
@@ -201,16 +247,14 @@ def show_profile_page():
     """User profile information. Assocated with a Globus Auth identity."""
 
     vc3_client = get_vc3_client()
-    userlist = vc3_client.listUsers()
+    userlist = lazy_list(vc3_client.listUsers)
 
     if request.method == 'GET':
-        profile = None
         sshpubstring = None
         name = None
 
-        for user in userlist:
-            if session['primary_identity'] == user.identity_id:
-                profile = user
+        profile = get_vc3_catalog().user_by_identity(
+            session['primary_identity'])
 
         if profile:
 
@@ -365,10 +409,6 @@ def authcallback():
             primary_username=id_token.get('preferred_username'),
             primary_identity=id_token.get('sub'),
         )
-        vc3_client = get_vc3_client()
-        userlist = vc3_client.listUsers()
-        profile = None
-
         ids = globusclient.get_identities(
             usernames=id_token.get('preferred_username', ''))
 
@@ -389,9 +429,8 @@ def authcallback():
         if not (email.split("@")[-1].split(".")[-1] in ["edu", "gov", "org", "ch", 'com']):
             return render_template('email_error.html')
 
-        for user in userlist:
-            if session['primary_identity'] == user.identity_id:
-                profile = user
+        profile = get_vc3_catalog().user_by_identity(
+            session['primary_identity'])
 
         if profile:
 
@@ -433,17 +472,15 @@ def whitelist_error():
 def portal():
     """Send the existing user to Portal Home."""
     vc3_client = get_vc3_client()
-    userlist = vc3_client.listUsers()
-    resources = vc3_client.listResources()
+    userlist = lazy_list(vc3_client.listUsers)
+    resources = lazy_list(vc3_client.listResources)
 
     if request.method == 'GET':
-        profile = None
         sshpubstring = None
         name = None
 
-        for user in userlist:
-            if session['primary_identity'] == user.identity_id:
-                profile = user
+        profile = get_vc3_catalog().user_by_identity(
+            session['primary_identity'])
 
         if profile:
 
@@ -479,8 +516,8 @@ def portal():
 def create_project():
     """ Creating New Project Form """
     vc3_client = get_vc3_client()
-    users = vc3_client.listUsers()
-    allocations = vc3_client.listAllocations()
+    users = lazy_list(vc3_client.listUsers)
+    allocations = lazy_list(vc3_client.listAllocations)
     if request.method == 'GET':
         owner = session['name']
 
@@ -491,7 +528,6 @@ def create_project():
         # Method to define and store projects
         # along with associated members and allocations
         # Initial members and allocations not required
-        projects = vc3_client.listProjects()
         name = request.form['name']
         owner = session['name']
         members = []
@@ -526,6 +562,7 @@ def create_project():
 
 @app.route('/project', methods=['GET'])
 @authenticated
+@conditional('project', 'user', 'allocation')
 def list_projects():
     """ Project List View """
     vc3_client = get_vc3_client()
@@ -552,21 +589,13 @@ def view_project(name):
         return redirect(url_for('list_projects'))
 
     vc3_client = get_vc3_client()
-    projects = vc3_client.listProjects()
-    allocations = vc3_client.listAllocations()
-    users = vc3_client.listUsers()
-    requests = vc3_client.listRequests()
+    projects, allocations, users = fetch_all(
+        vc3_client.listProjects, vc3_client.listAllocations,
+        vc3_client.listUsers)
+    # use headnode structure in the profile.
+    requests = lazy_list(requests_with_headnodes, vc3_client,
+                         lazy_list(vc3_client.listRequests))
     project = None
-    headnode = None
-
-    for vc3_request in requests:
-        if vc3_request.headnode:
-            try:
-                headnode = vc3_client.getNodeset(vc3_request.headnode)
-            except:
-                pass
-        # use headnode structure in the profile.
-        vc3_request.headnode = headnode
     # Scanning list of projects and matching with name of project argument
 
     project = vc3_client.getProject(projectname=name)
@@ -737,9 +766,9 @@ def create_cluster():
     """ Create New Cluster Template Form """
 
     vc3_client = get_vc3_client()
-    clusters = vc3_client.listClusters()
-    projects = vc3_client.listProjects()
-    nodesets = vc3_client.listNodesets()
+    clusters = lazy_list(vc3_client.listClusters)
+    projects = lazy_list(vc3_client.listProjects)
+    nodesets = lazy_list(vc3_client.listNodesets)
 
     if request.method == 'GET':
         return render_template('cluster_new.html', clusters=clusters,
@@ -793,7 +822,7 @@ def list_clusters():
     """ List Cluster Template View """
     vc3_client = get_vc3_client()
     clusters = vc3_client.listClusters()
-    projects = vc3_client.listProjects()
+    projects = lazy_list(vc3_client.listProjects)
     nodesets = vc3_client.listNodesets()
 
     return render_template('cluster.html', clusters=clusters,
@@ -810,13 +839,11 @@ def view_cluster(name):
     :return: Cluster Template profile view specific to cluster name
     """
     vc3_client = get_vc3_client()
-    clusters = vc3_client.listClusters()
-    projects = vc3_client.listProjects()
-    nodesets = vc3_client.listNodesets()
-    users = vc3_client.listUsers()
-    cluster = None
-
-    cluster = vc3_client.getCluster(clustername=name)
+    clusters = lazy_list(vc3_client.listClusters)
+    projects = lazy_list(vc3_client.listProjects)
+    nodesets, users, cluster = fetch_all(
+        vc3_client.listNodesets, vc3_client.listUsers,
+        functools.partial(vc3_client.getCluster, clustername=name))
     if cluster:
         cluster_name = cluster.name
         owner = cluster.owner
@@ -843,9 +870,9 @@ def edit_cluster(name):
     :return: Edit Page with information pertaining to the cluster template
     """
     vc3_client = get_vc3_client()
-    clusters = vc3_client.listClusters()
-    projects = vc3_client.listProjects()
-    nodesets = vc3_client.listNodesets()
+    clusters = lazy_list(vc3_client.listClusters)
+    projects = lazy_list(vc3_client.listProjects)
+    nodesets = lazy_list(vc3_client.listNodesets)
     frameworks = []
 
     if request.method == 'GET':
@@ -932,13 +959,14 @@ def delete_cluster(name):
 
 @app.route('/allocation', methods=['GET'])
 @authenticated
+@conditional('allocation', 'resource', 'project', 'user')
 def list_allocations():
     """ List Allocations Page """
     vc3_client = get_vc3_client()
-    allocations = vc3_client.listAllocations()
-    resources = vc3_client.listResources()
-    projects = vc3_client.listProjects()
-    users = vc3_client.listUsers()
+    allocations, resources = fetch_all(vc3_client.listAllocations,
+                                       vc3_client.listResources)
+    projects = lazy_list(vc3_client.listProjects)
+    users = lazy_list(vc3_client.listUsers)
     allocation_list = []
 
     for allocation in allocations:
@@ -1009,9 +1037,9 @@ def view_allocation(name):
     :return: Allocation detailed page with associated attributes
     """
     vc3_client = get_vc3_client()
-    allocations = vc3_client.listAllocations()
-    resources = vc3_client.listResources()
-    users = vc3_client.listUsers()
+    allocations = lazy_list(vc3_client.listAllocations)
+    resources = lazy_list(vc3_client.listResources)
+    users = lazy_list(vc3_client.listUsers)
     allocation = vc3_client.getAllocation(allocationname=name)
 
     if request.method == 'GET':
@@ -1097,8 +1125,7 @@ def validate_allocation(name):
 @allocation_validated
 def edit_allocation(name):
     vc3_client = get_vc3_client()
-    allocations = vc3_client.listAllocations()
-    resources = vc3_client.listResources()
+    resources = lazy_list(vc3_client.listResources)
 
     allocation = vc3_client.getAllocation(allocationname=name)
 
@@ -1163,7 +1190,8 @@ def delete_allocation(name):
 def list_resources():
     """ Route for HPC and Resources List View """
     vc3_client = get_vc3_client()
-    resources = vc3_client.listResources()
+    resources = resources_with_nodeinfo(vc3_client,
+                                        vc3_client.listResources())
 
     return render_template('resource.html', resources=resources)
 
@@ -1220,9 +1248,10 @@ def admin():
                                        'c456b77c-d274-11e5-b82c-23a245a48997',
                                        'c444a294-d274-11e5-b7f1-e3782ed16687']:
         vc3_client = get_vc3_client()
-        vc3_requests = vc3_client.listRequests()
-        nodesets = vc3_client.listNodesets()
-        clusters = vc3_client.listClusters
+        vc3_requests = requests_with_clusters(vc3_client,
+                                              vc3_client.listRequests())
+        nodesets = lazy_list(vc3_client.listNodesets)
+        clusters = lazy_list(vc3_client.listClusters)
         request_list = []
 
         for vc3_request in vc3_requests:
@@ -1237,33 +1266,35 @@ def admin():
 
 @app.route('/request', methods=['GET'])
 @authenticated
+@conditional('request', 'cluster', 'project', 'nodeset')
 def list_requests():
     """ List View of Virtual Clusters """
     vc3_client = get_vc3_client()
-    vc3_requests = vc3_client.listRequests()
-    nodesets = vc3_client.listNodesets()
+    vc3_requests = requests_with_clusters(vc3_client,
+                                          vc3_client.listRequests())
+    nodesets = lazy_list(vc3_client.listNodesets)
     clusters = vc3_client.listClusters()
     request_list = []
     projects = []
 
+    # Resolve every project and headnode with one bulk fetch each
+    associated_projects = vc3_client.get_many(
+        'project', [r.project for r in vc3_requests])
+    headnodes = vc3_client.get_many(
+        'nodeset', [r.headnode for r in vc3_requests if r.headnode])
+
     for vc3_request in vc3_requests:
-        vc_projectname = vc3_request.project
-        associated_project = vc3_client.getProject(projectname=vc_projectname)
+        associated_project = associated_projects.get(vc3_request.project)
 
         if vc3_request.owner == session['name']:
             request_list.append(str(vc3_request.name))
 
-        if session['name'] in associated_project.members:
+        if (associated_project is not None and
+                session['name'] in associated_project.members):
             request_list.append(str(vc3_request.name))
 
-        headnode = None
-        if vc3_request.headnode:
-            try:
-                headnode = vc3_client.getNodeset(vc3_request.headnode)
-            except:
-                pass
         # use headnode structure in the profile.
-        vc3_request.headnode = headnode
+        vc3_request.headnode = headnodes.get(vc3_request.headnode)
 
         # convert expiration to readable format
         expiration_utc = vc3_request.expiration
@@ -1309,16 +1340,14 @@ def create_request(project):
     """
     vc3_client = get_vc3_client()
     if request.method == 'GET':
-        clusters = vc3_client.listClusters()
-        projects = vc3_client.listProjects()
-        environments = vc3_client.listEnvironments()
-        get_project = vc3_client.getProject(projectname=project)
+        clusters, environments, get_project = fetch_all(
+            vc3_client.listClusters, vc3_client.listEnvironments,
+            functools.partial(vc3_client.getProject, projectname=project))
         project = get_project.name
-        allocations = []
-
-        for allocation in get_project.allocations:
-            allocations.append(vc3_client.getAllocation(
-                allocationname=allocation))
+        project_allocations = vc3_client.get_many('allocation',
+                                                  get_project.allocations)
+        allocations = [project_allocations[a] for a in get_project.allocations
+                       if a in project_allocations]
 
         return render_template('request_new.html',
                                clusters=clusters, allocations=allocations,
@@ -1414,10 +1443,10 @@ def create_request(project):
             # description_input = request.form['description']
             # description = str(description_input)
 
-            allocations = vc3_client.listAllocations()
-            clusters = vc3_client.listClusters()
-            projects = vc3_client.listProjects()
-            environments = vc3_client.listEnvironments()
+            allocations = lazy_list(vc3_client.listAllocations)
+            clusters = lazy_list(vc3_client.listClusters)
+            projects = lazy_list(vc3_client.listProjects)
+            environments = lazy_list(vc3_client.listEnvironments)
             flash('You have already launched a Virtual Cluster with that name.'
                   'Please choose a different name.', 'warning')
             return render_template('request_new.html', cluster=cluster,
@@ -1448,15 +1477,15 @@ def view_request(name):
         return redirect(url_for('list_requests'))
 
     vc3_client = get_vc3_client()
-    vc3_requests = vc3_client.listRequests()
-    nodesets = vc3_client.listNodesets()
-    clusters = vc3_client.listClusters
-    users = vc3_client.listUsers()
+    vc3_requests = lazy_list(vc3_client.listRequests)
+    nodesets = lazy_list(vc3_client.listNodesets)
+    clusters = lazy_list(vc3_client.listClusters)
     vc3_request = None
-    allocations = vc3_client.listAllocations()
 
     if request.method == 'GET':
-        vc3_request = vc3_client.getRequest(requestname=name)
+        users, allocations, vc3_request = fetch_all(
+            vc3_client.listUsers, vc3_client.listAllocations,
+            functools.partial(vc3_client.getRequest, requestname=name))
         if vc3_request:
             requestname = vc3_request.name
             owner = vc3_request.owner
@@ -1478,6 +1507,8 @@ def view_request(name):
 
             # use headnode structure in the profile.
             vc3_request.headnode = headnode
+            clusterinfo = vc3_client.getCluster(
+                clustername=vc3_request.cluster)
 
             expiration_utc = vc3_request.expiration
             local_timezone = tzlocal.get_localzone()  # get pytz tzinfo
@@ -1498,7 +1529,8 @@ def view_request(name):
                                    vc3allocations=vc3allocations, project=project,
                                    allocations=allocations, description=description,
                                    profile=profile, vc3_request=vc3_request,
-                                   displayname=displayname, expiration=local_time)
+                                   displayname=displayname, expiration=local_time,
+                                   clusterinfo=clusterinfo)
         app.logger.error("Could not find VC when viewing: {0}".format(name))
         raise LookupError('virtual cluster')
 
@@ -1655,7 +1687,7 @@ def create_environment():
     os_list = oss.split()
 
     if request.method == 'GET':
-        environments = vc3_client.listEnvironments()
+        environments = lazy_list(vc3_client.listEnvironments)
         return render_template('environment_new.html',
                                environments=environments, recipes=recipe_list,
                                recipe_list_section=recipes_section, oss=os_list)
@@ -1691,7 +1723,7 @@ def create_environment():
             name = request.form['name']
             # description_input = request.form['description']
             # description = str(description_input)
-            environments = vc3_client.listEnvironments()
+            environments = lazy_list(vc3_client.listEnvironments)
             flash('You have already created an environment with that name.', 'warning')
             return render_template('environment_new.html', name=name,
                                    packagelist=packagelist, required_os=required_os,
@@ -1713,7 +1745,6 @@ def view_environment(name):
     :return: Cluster Template profile view specific to cluster name
     """
     vc3_client = get_vc3_client()
-    environments = vc3_client.listEnvironments()
     users = vc3_client.listUsers()
     environment = None
 
@@ -1795,7 +1826,7 @@ def edit_environment_os(name):
             updated_environment.required_os = required_os_strict
             vc3_client.storeEnvironment(updated_environment)
         except:
-            environments = vc3_client.listEnvironments()
+            environments = lazy_list(vc3_client.listEnvironments)
             flash('You have already created an environment with that name.', 'warning')
             return render_template('environment_new.html', name=name,
                                    required_os=required_os,
@@ -2,9 +2,11 @@
 
 
 import time
-from portal import app
+from portal import app, start
 
 app.logger.info('{0} Application started'.format(time.ctime()))
 
 if __name__ == "__main__":
-     app.run(host='localhost')
+     start()
+     # status event streams hold a thread each while they are open
+     app.run(host='localhost', threaded=True)